@@ -0,0 +1,214 @@
+"""
+Offline benchmarks of the indicators in lib.indicators on seeded synthetic data.
+
+  $ python -m lib.benchmark --lengths 1000 5000 --output benchmarks/HEAD.json
+  $ python -m lib.benchmark --baseline benchmarks/HEAD.json
+
+Every indicator is timed for each generator in lib.synthetic, series length
+and period, and its peak memory is measured in a separate traced run. The
+results (and the commit they were measured on) can be saved as JSON, and a
+run compared against a saved baseline flags the cases whose bars per second
+dropped by more than the tolerance.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tracemalloc
+import numpy
+
+from lib.synthetic import GENERATORS
+from lib.indicators.entropy import shen, apen, sampen
+from lib.indicators.chaos import lyapunov
+from lib.indicators.complexity import complexity
+from lib.indicators.information import mutual, mutual_profile
+from lib.indicators.multifractal import mfs, mfs_width, mfs_height
+from lib.indicators.recurrence import rqa, rate, determinism, laminarity
+
+
+# name: (indicator, fixed parameters, period parameter, periods, longest series)
+CASES = {
+    "shen": (shen, {}, "period", (50, 100), None),
+    "shen incremental": (shen, {"incremental": True}, "period", (50, 100), None),
+    "apen": (apen, {}, "period", (50, 100), None),
+    "apen incremental": (apen, {"incremental": True}, "period", (50, 100), None),
+    "sampen": (sampen, {}, "period", (50, 100), None),
+    "lyapunov": (lyapunov, {}, "period", (50, 100), None),
+    "complexity": (complexity, {}, "period", (50, 100), None),
+    "mutual constant delay": (mutual, {"delay": 7, "max_delay": None}, "period", (48, 96), None),
+    "mutual incremental": (mutual, {"delay": 7, "max_delay": None, "incremental": True},
+                           "period", (48, 96), None),
+    "mutual first minimum": (mutual, {"delay": None, "max_delay": 20, "method": "first minimum"},
+                             "period", (48, 96), None),
+    "mutual profile": (mutual_profile, {"max_delay": 20}, "period", (48, 96), None),
+    "mfs": (mfs, {}, "length", (2**6, 2**7), None),
+    "mfs_width": (mfs_width, {}, "length", (2**6, 2**7), None),
+    "mfs_height": (mfs_height, {}, "length", (2**6, 2**7), None),
+    "rqa": (rqa, {}, "period", (50, 100), 300), # pyrqa, about 40 ms per bar
+    "rqa incremental": (rqa, {"incremental": True}, "period", (50, 100), None),
+    "rate": (rate, {}, "period", (50, 100), 300),
+    "determinism": (determinism, {}, "period", (50, 100), 300),
+    "laminarity": (laminarity, {}, "period", (50, 100), 300),
+}
+
+
+def run(lengths=(1000, 5000), generators=None, indicators=None, repeat: int = 1, seed: int = 0,
+        memory: bool = True, report=None):
+    """
+    Benchmark the indicators (names in CASES, all if None) on the generators
+    (names in lib.synthetic.GENERATORS, all if None) for every series length
+    and period. Cases are timed as the best of repeat runs.
+
+    Output:
+      list of records: indicator, generator, bars, period, seconds,
+      bars_per_second and peak_memory_mb (None without memory)
+    """
+
+    records = []
+    for name in indicators or CASES:
+        indicator, parameters, key, periods, longest = CASES[name]
+
+        for generator in generators or GENERATORS:
+            for bars in sorted({min(n, longest or n) for n in lengths}):
+                data = GENERATORS[generator](bars, seed=seed)
+
+                for period in periods:
+                    arguments = dict(parameters, **{key: period})
+
+                    seconds = min(_time(indicator, data, arguments) for _ in range(repeat))
+                    peak = _peak(indicator, data, arguments) if memory else None
+
+                    record = {"indicator": name, "generator": generator, "bars": bars,
+                              "period": period, "seconds": seconds,
+                              "bars_per_second": bars / seconds if seconds > 0 else float("inf"),
+                              "peak_memory_mb": peak}
+                    records.append(record)
+                    if report is not None:
+                        report(record)
+
+    return records
+
+
+def compare(baseline, records, tolerance: float = 0.2):
+    """
+    Match records to a baseline by indicator, generator, bars and period.
+
+    Output:
+      list of (record, baseline bars per second, speed ratio, regressed), the
+      ratio being current / baseline bars per second and regressed telling
+      whether it fell below 1 - tolerance
+    """
+
+    def _key(record):
+        return record["indicator"], record["generator"], record["bars"], record["period"]
+
+    previous = {_key(record): record for record in baseline}
+    rows = []
+    for record in records:
+        if _key(record) in previous:
+            before = previous[_key(record)]["bars_per_second"]
+            ratio = record["bars_per_second"] / before
+            rows.append((record, before, ratio, ratio < 1 - tolerance))
+
+    return rows
+
+
+def save(records, path: str):
+
+    metadata = {"commit": _commit(), "python": platform.python_version(),
+                "numpy": numpy.__version__, "machine": platform.machine(),
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as file:
+        json.dump({"metadata": metadata, "results": records}, file, indent=1)
+
+
+def load(path: str):
+
+    with open(path) as file:
+        return json.load(file)["results"]
+
+
+def _time(indicator, data, arguments):
+
+    began = time.perf_counter()
+    indicator(data, **arguments)
+    return time.perf_counter() - began
+
+
+def _peak(indicator, data, arguments):
+
+    # Traced separately: tracemalloc slows every allocation down
+    tracemalloc.start()
+    try:
+        indicator(data, **arguments)
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+
+
+def _commit():
+
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _write(record):
+
+    memory = "" if record["peak_memory_mb"] is None else "%10.1f MB" % record["peak_memory_mb"]
+    print("%-24s %-9s %8d bars  period %4d  %10.0f bars/s%s" % (
+        record["indicator"], record["generator"], record["bars"], record["period"],
+        record["bars_per_second"], memory), file=sys.stderr)
+
+
+def main(arguments=None):
+
+    parser = argparse.ArgumentParser(description="Benchmark the indicators on synthetic data.")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--generators", nargs="+", choices=list(GENERATORS))
+    parser.add_argument("--indicators", nargs="+", choices=list(CASES))
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", action="store_true", help="skip the traced memory runs")
+    parser.add_argument("--output", help="save the results as JSON")
+    parser.add_argument("--baseline", help="compare against results saved with --output")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    options = parser.parse_args(arguments)
+
+    # Checked up front rather than after the whole run
+    if options.output:
+        directory = os.path.dirname(os.path.abspath(options.output))
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError as error:
+            parser.error("cannot create %s: %s" % (directory, error.strerror))
+        if not os.access(directory, os.W_OK):
+            parser.error("cannot write to %s" % directory)
+
+    records = run(options.lengths, options.generators, options.indicators, options.repeat,
+                  options.seed, not options.no_memory, report=_write)
+
+    if options.output:
+        save(records, options.output)
+
+    regressed = False
+    if options.baseline:
+        for record, before, ratio, slower in compare(load(options.baseline), records,
+                                                     options.tolerance):
+            regressed |= slower
+            print("%-24s %-9s %8d bars  period %4d  %10.0f -> %10.0f bars/s  x%.2f%s" % (
+                record["indicator"], record["generator"], record["bars"], record["period"],
+                before, record["bars_per_second"], ratio, "  REGRESSION" if slower else ""))
+
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+import os
+import json
+import time
+import pickle
+import hashlib
+import numpy
+import pandas
+
+
+class Cache:
+    """
+    On-disk cache of rolling indicator results.
+
+    Pass an instance as cache= to an indicator (or to lib.rolling directly).
+    Results are stored as NPY files in directory, keyed by the indicator and
+    its parameters (period, q_range, delay, ...) and fingerprinted by the bars
+    and timestamps they were computed on. A rerun on the same data loads the
+    result; a run on data that extends cached bars loads them and computes
+    only the windows ending at the new bars.
+
+    Once the files exceed max_bytes, the least recently used results are
+    evicted. The cache is not locked: use it from one process at a time, and
+    clear it after upgrading the indicators.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 2**30):
+
+        self.directory = os.path.expanduser(directory)
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, *parameters):
+        """ Key of a computation: the parameters have to be picklable. """
+        return hashlib.blake2b(pickle.dumps(parameters, protocol=4), digest_size=16).hexdigest()
+
+    def lookup(self, key: str, values, index):
+        """
+        Longest cached result of key computed on a prefix of values and index.
+
+        Output:
+          (number of cached bars, their results), (0, None) on a miss
+        """
+
+        entries = self._read()
+
+        # Longest candidates first, each prefix length fingerprinted once
+        candidates = sorted((name for name, entry in entries.items()
+                             if entry["key"] == key and entry["length"] <= len(values)),
+                            key=lambda name: entries[name]["length"], reverse=True)
+        digests = {}
+        found = None
+        for name in candidates:
+            length = entries[name]["length"]
+            if length not in digests:
+                digests[length] = fingerprint(values[:length], index[:length])
+            if digests[length] == entries[name]["fingerprint"]:
+                found = name
+                break
+
+        if found is None:
+            return 0, None
+
+        try:
+            result = numpy.load(self._path(found))
+        except (OSError, ValueError):
+            return 0, None
+
+        entries[found]["used"] = time.time()
+        self._write(entries)
+        return entries[found]["length"], result
+
+    def store(self, key: str, values, index, result, extended: int = 0):
+        """
+        Save the result of key computed on values and index, then evict. A result
+        extending the one lookup found, of its first extended bars, replaces it.
+        """
+
+        digest = fingerprint(values, index)
+        name = hashlib.blake2b((key + digest).encode(), digest_size=16).hexdigest()
+        numpy.save(self._path(name), result)
+
+        entries = self._read()
+        if 0 < extended < len(values):
+            prefix = fingerprint(values[:extended], index[:extended])
+            for old in [old for old, entry in entries.items() if entry["key"] == key
+                        and entry["length"] == extended and entry["fingerprint"] == prefix]:
+                del entries[old]
+                self._remove(old)
+
+        entries[name] = {"key": key, "length": len(values), "fingerprint": digest,
+                         "bytes": os.path.getsize(self._path(name)), "used": time.time()}
+
+        # Least recently used first
+        total = sum(entry["bytes"] for entry in entries.values())
+        for old in sorted(entries, key=lambda old: entries[old]["used"]):
+            if total <= self.max_bytes:
+                break
+            if old != name:
+                total -= entries.pop(old)["bytes"]
+                self._remove(old)
+
+        self._write(entries)
+
+    def clear(self):
+
+        for name in self._read():
+            self._remove(name)
+        self._write({})
+
+    def _path(self, name):
+        return os.path.join(self.directory, name + ".npy")
+
+    def _remove(self, name):
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            pass
+
+    def _read(self):
+        try:
+            with open(os.path.join(self.directory, "index.json")) as file:
+                return json.load(file)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _write(self, entries):
+
+        # Replaced atomically, so an interrupted run never leaves a torn index
+        path = os.path.join(self.directory, "index.json")
+        with open(path + ".tmp", "w") as file:
+            json.dump(entries, file)
+        os.replace(path + ".tmp", path)
+
+
+def fingerprint(values, index, chunk: int = 2**20):
+    """ Digest of the bars and timestamps of a series, read a chunk at a time. """
+
+    digest = hashlib.blake2b(digest_size=16)
+    for start in range(0, len(values), chunk):
+        part = numpy.ascontiguousarray(values[start:start + chunk], dtype=numpy.float64)
+        digest.update(part.tobytes())
+    for start in range(0, len(index), chunk):
+        part = pandas.util.hash_array(numpy.asarray(index[start:start + chunk]))
+        digest.update(part.tobytes())
+    return digest.hexdigest()
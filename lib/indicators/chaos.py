@@ -1,34 +1,28 @@
 import numpy
 import pandas
 from lib.salib import Chaos
+from lib.rolling import rolling
 
-def lyapunov(data: pandas.Series, period: int):
+DIAMETER_SET = 2 ** numpy.linspace(0, -50, 200) * 5
 
-    N = len(data)
-    df = pandas.DataFrame(index=data.index, columns=["indicator"])
-    print(f"Period = {period}\nData length = {N}\n")
+def _lyapunov(x):
 
-    for t in range(period - 1, N):
+    period = len(x)
+    distances = numpy.abs(x[:, None] - x[None, :])
 
-        x = data[t - (period - 1):t + 1].values
+    # Diameter selection: the first (largest) diameter with at most 15 pairs within it
+    pairs = numpy.sort(distances[numpy.triu_indices(period, k=1)])
+    counters = numpy.searchsorted(pairs, DIAMETER_SET, side='right')
+    selected = numpy.flatnonzero(counters <= 15)
+    diameter = DIAMETER_SET[selected[0]] if len(selected) else DIAMETER_SET[-1]
 
-        # Diameter selection
-        diameter_set = 2 ** numpy.linspace(0, -50, 200) * 5
+    # Lyapunov exponent
+    return Chaos.lyapunov_exponent(x, candle_range=period, initial_diameter=diameter,
+                                   display=False, distances=distances)
 
-        for diameter in diameter_set:
-            counter = 0
-            for i in range(period):
-                for j in range(i + 1, period):
+def lyapunov(data: pandas.Series, period: int, n_jobs: int = 1, progress=None, cache=None,
+             previous=None, dtype=numpy.float64, out=None):
 
-                    if numpy.abs(x[i] - x[j]) <= diameter:
-                        counter += 1
-            if counter <= 15: break
-
-        # Lyapunov exponent
-        lyapunov = Chaos.lyapunov_exponent(x, candle_range=period, initial_diameter=diameter, display=False)
-        df.loc[df.index[t]] = [lyapunov]
-
-        print("t = %d; Lyapunov exp. = %f" % (t, lyapunov), end='')
-        print("\t\t\t", end='\r')
-
-    return df
\ No newline at end of file
+    series = rolling(data, period, _lyapunov, label="Lyapunov exp.", n_jobs=n_jobs,
+                     progress=progress, cache=cache, previous=previous, dtype=dtype, out=out)
+    return series.to_frame()
@@ -1,21 +1,21 @@
 import numpy
 import pandas
 from lib.salib import Complexity
+from lib.rolling import rolling
 
-def complexity(data: pandas.Series, period: int):
+def _lempel_ziv(stack):
 
-    N = len(data)
-    df = pandas.DataFrame(index=data.index, columns=["indicator"])
-    print(f"Period = {period}\nData length = {N}\n")
+    # All windows of the stack are binarized into packed bits at once
+    length = stack.shape[-1]
+    packed = Complexity.binarizer(stack)
+    packed = packed.reshape(-1, packed.shape[-1])
+    values = [Complexity.lempel_ziv(bits, length=length) for bits in packed]
+    return numpy.array(values, dtype=float).reshape(stack.shape[:-1])
 
-    for t in range(period - 1, N):
+def complexity(data: pandas.Series, period: int, n_jobs: int = 1, progress=None, cache=None,
+               previous=None, dtype=numpy.float64, out=None):
 
-        x = data[t - (period - 1):t + 1].values
-        binary_sequence = Complexity.binarizer(x)
-        complexity = Complexity.lempel_ziv(numpy.array(binary_sequence))
-        df.loc[df.index[t]] = [complexity]
-
-        print("t = %d; Lempel-Ziv complexity = %f" % (t, complexity), end='')
-        print("\t\t\t", end='\r')
-
-    return df
\ No newline at end of file
+    series = rolling(data, period, _lempel_ziv, label="Lempel-Ziv complexity", n_jobs=n_jobs,
+                     stacked=True, progress=progress, cache=cache, previous=previous,
+                     dtype=dtype, out=out)
+    return series.to_frame()
@@ -1,35 +1,43 @@
+import numpy
 import pandas
+from functools import partial
 from lib.salib import Entropy
-
-def shen(data: pandas.Series, period: int):
-
-    N = len(data)
-    df = pandas.DataFrame(index=data.index, columns=["indicator"])
-    print(f"Period = {period}\nData length = {N}\n")
-
-    for t in range(period - 1, N):
-
-        x = data[t - (period - 1):t + 1].values
-        se = Entropy.shannon(x)
-        df.loc[df.index[t]] = [se]
-
-        print("t = %d; Shannon entropy = %f" % (t, se), end='')
-        print("\t\t\t", end='\r')
-    return df
-
-def apen(data: pandas.Series, period: int):
-
-    N = len(data)
-    df = pandas.DataFrame(index=data.index, columns=["indicator"])
-    print(f"Period = {period}\nData length = {N}\n")
-
-    for t in range(period - 1, N):
-
-        x = data[t - (period - 1):t + 1].values
-        ae = Entropy.approximate(x, m=2, r=3)
-        df.loc[df.index[t]] = [ae]
-
-        print("t = %d; Approximate entropy = %f" % (t, ae), end='')
-        print("\t\t\t", end='\r')
-
-    return df
\ No newline at end of file
+from lib.rolling import rolling, replay
+from lib.streaming import Shannon, ApproximateEntropy
+
+def shen(data: pandas.Series, period: int, incremental: bool = False, resync: int = 1000,
+         n_jobs: int = 1, progress=None, cache=None, previous=None, dtype=numpy.float64, out=None):
+
+    # Incremental mode keeps running sums instead of rescanning each window; the batch
+    # mode computes whole stacks of windows at once
+    if incremental:
+        series = replay(data, Shannon(period, resync), label="Shannon entropy",
+                        n_jobs=n_jobs, progress=progress, cache=cache, previous=previous,
+                        dtype=dtype, out=out)
+    else:
+        series = rolling(data, period, Entropy.shannon, label="Shannon entropy",
+                         n_jobs=n_jobs, stacked=True, progress=progress, cache=cache,
+                         previous=previous, dtype=dtype, out=out)
+    return series.to_frame()
+
+def apen(data: pandas.Series, period: int, incremental: bool = False, n_jobs: int = 1,
+         progress=None, cache=None, previous=None, dtype=numpy.float64, out=None):
+
+    # Incremental mode only updates the match counts of the leaving and entering templates
+    if incremental:
+        series = replay(data, ApproximateEntropy(period, m=2, r=3),
+                        label="Approximate entropy", n_jobs=n_jobs, progress=progress,
+                        cache=cache, previous=previous, dtype=dtype, out=out)
+    else:
+        series = rolling(data, period, partial(Entropy.approximate, m=2, r=3),
+                         label="Approximate entropy", n_jobs=n_jobs, progress=progress,
+                         cache=cache, previous=previous, dtype=dtype, out=out)
+    return series.to_frame()
+
+def sampen(data: pandas.Series, period: int, n_jobs: int = 1, progress=None, cache=None,
+           previous=None, dtype=numpy.float64, out=None):
+
+    series = rolling(data, period, partial(Entropy.sample, m=2, r=3),
+                     label="Sample entropy", n_jobs=n_jobs, progress=progress, cache=cache,
+                     previous=previous, dtype=dtype, out=out)
+    return series.to_frame()
@@ -1,59 +1,182 @@
 import numpy
 import pandas
-from pyinform import mutual_info
+from functools import partial
+
 from lib.salib import Information
+from lib.progress import reporter
+from lib.rolling import rolling, replay, execute, workers
+from lib.streaming import MutualInformation
 
 
-def mutual(data: pandas.Series, period: int, delay: int,
-          max_delay: int, method: str = 'constant delay'):
-    # Delay time (should be less than 'length')
+def _constant_delay(x, period, bins):
 
-    N = len(data)
-    df = pandas.DataFrame(index=data.index, columns=["indicator"])
+    # Windows span period + delay bars: the unlagged part leads, the lagged part trails
+    unlagged = x[:period]
+    lagged = x[len(x) - period:]
+    return Information.mutual(unlagged, lagged, local=False, bins=bins)
 
-    if method == 'constant delay':
+def _first_minimum(x, max_delay, bins):
 
-        print(f"Period = {period}\nData length = {N}\n")
-        for t in range(period - 1 + delay, N):
+    information = Information.profile(x, max_delay, bins)
+    rises = numpy.flatnonzero(information[:-1] < information[1:]) # First local minimum
+    return rises[0] + 1 if len(rises) else numpy.nan
 
-            unlagged = data[t - (period - 1) - delay:t + 1 - delay].values
-            lagged = data[t - (period - 1):t + 1].values
+def mutual(data: pandas.Series, period: int, delay: int,
+          max_delay: int, method: str = 'constant delay', bins: int = None,
+          incremental: bool = False, resync: int = 1000, n_jobs: int = 1, progress=None,
+          cache=None, previous=None, dtype=numpy.float64, out=None):
+    # Delay time (should be less than 'length')
+    # bins: equal-frequency bins per window, values truncated to integers if None
 
-            info = Information.mutual(unlagged, lagged, local=False)
-            df.loc[df.index[t]] = [info]
+    # Incremental mode keeps the joint and marginal counts of the constant delay pairs
+    if incremental:
+        if method != 'constant delay' or bins is not None:
+            raise ValueError("Incremental mode needs the constant delay method without bins.")
+        series = replay(data, MutualInformation(period, delay, resync), label="Mutual info.",
+                        n_jobs=n_jobs, progress=progress, cache=cache, previous=previous,
+                        dtype=dtype, out=out)
 
-            print("t = %d; Mutual info. = %f" % (t, info), end='')
-            print("\t\t\t", end='\r')
+    elif method == 'constant delay':
+        series = rolling(data, period + delay, partial(_constant_delay, period=period, bins=bins),
+                         label="Mutual info.", n_jobs=n_jobs, progress=progress, cache=cache,
+                         previous=previous, dtype=dtype, out=out)
 
     elif method == 'first minimum':
+        series = rolling(data, period, partial(_first_minimum, max_delay=max_delay, bins=bins),
+                         label="First minimum of mutual info.", n_jobs=n_jobs,
+                         progress=progress, cache=cache, previous=previous, dtype=dtype, out=out)
 
-        print(f"Period = {period}\nData length = {N}\n")
-
-        for t in range(period - 1, N):
-
-            x = data[t - (period - 1):t + 1].values
-            information = []
-            for tau in range(1, max_delay + 1):
-
-                unlagged = x[:-tau]
-                lagged = numpy.roll(x, -tau)[:-tau]
-
-                if len(unlagged):
-
-                    info = mutual_info(unlagged, lagged, local=False)
-                    information.append(info)
-
-                    print("t = %d; tau = %d; mutual information = %.5f" % (t, tau, info), end='')
-                    print("\t\t\t", end='\r')
-
-                    if len(information) > 1 and information[-2] < information[-1]: # First local minimum
-                        first_minimum = tau - 1
-                        df.loc[df.index[t]] = [first_minimum]
-                        break
-                    #else:
-                    #    first_minimum = min(information)
-                    #    df.loc[df.index[t]] = [first_minimum]
     else:
         raise ValueError("Choose method.")
 
-    return df
\ No newline at end of file
+    return series.to_frame()
+
+def mutual_profile(data: pandas.Series, period: int, max_delay: int, bins: int = None,
+                   n_jobs: int = 1, progress=None, cache=None, previous=None,
+                   dtype=numpy.float64, out=None):
+    """
+    Rolling mutual information (bits) between each window and itself delayed by
+    1..max_delay bars, one column per delay.
+    """
+
+    kernel = partial(Information.profile, max_delay=max_delay, bins=bins)
+    return rolling(data, period, kernel, label="Mutual info. profile", n_jobs=n_jobs,
+                   progress=progress, columns=list(range(1, max_delay + 1)), cache=cache,
+                   previous=previous, dtype=dtype, out=out)
+
+def cross_mutual(data, period: int, max_delay: int, bins: int = None, n_jobs: int = 1,
+                 progress=None, path: str = None, dtype=numpy.float64):
+    """
+    Rolling lagged mutual information between every pair of N aligned series.
+
+    Input:
+      data      -- pandas.DataFrame (columns = tickers) or 2-D array (bars x series)
+      period    -- pairs per window
+      max_delay -- largest lead or lag L, in bars
+      bins      -- equal-frequency bins within every window, as in mutual, values
+                   truncated to integers if None
+      n_jobs    -- number of worker processes the series pairs are split across,
+                   -1 for one per CPU
+      progress  -- lib.progress.Progress or callback, advanced as pairs finish
+      path      -- .npy file backing the output as a memory map
+      dtype     -- dtype of the output, numpy.float32 halves it
+
+    Output:
+      (bars, N, N, 2L + 1) array, NaN during the first period + L - 1 bars.
+      [t, i, j, L + tau] is the mutual information in bits between series i at
+      s and series j at s + tau over the window ending at bar t, so series i
+      leads j for tau > 0.
+
+    Truncated series are discretized once. With bins, the period bars ending at
+    every bar are binned among themselves, so no value depends on later bars.
+    Since [t, i, j, L + tau] equals [t, j, i, L - tau], only the pairs i <= j
+    are computed and mirrored, their joint histograms for all delays counted
+    together in blocks of bars.
+    """
+
+    values = numpy.asarray(data, dtype=numpy.float64)
+    bars, N = values.shape
+    if bins is None:
+        codes = numpy.stack([Information.discretize(values[:, i]) for i in range(N)])
+    else:
+        codes = numpy.ascontiguousarray(values.T)
+
+    pairs = numpy.array([(i, j) for i in range(N) for j in range(i, N)]).reshape(-1, 2)
+    shape = (bars, N, N, 2 * max_delay + 1)
+    if path is None:
+        tensor = numpy.empty(shape, dtype=dtype)
+    else:
+        tensor = numpy.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+
+    progress = reporter(progress)
+    if progress is not None:
+        progress.start("Cross mutual info.", len(pairs))
+
+    n_jobs = workers(n_jobs)
+
+    # Tasks of pairs whose results stay around 16M values
+    size = max(1, 2**24 // (bars * shape[-1]))
+    if n_jobs > 1:
+        size = max(1, min(size, -(-len(pairs) // (4 * n_jobs))))
+    tasks = [pairs[start:start + size] for start in range(0, len(pairs), size)]
+
+    def _store(k, information):
+        i, j = tasks[k][:, 0], tasks[k][:, 1]
+        tensor[:, i, j] = information
+        tensor[:, j, i] = information[..., ::-1]
+        if progress is not None:
+            progress.advance(len(tasks[k]))
+
+    execute(_cross, [(codes, task, period, max_delay, bins) for task in tasks], n_jobs, _store)
+
+    if progress is not None:
+        progress.finish()
+    if path is not None:
+        tensor.flush()
+    return tensor
+
+def _cross(codes, pairs, period, max_delay, bins=None):
+
+    # codes are the symbols of every series, or its values to be binned within windows
+    bars = codes.shape[1]
+    lags = numpy.arange(-max_delay, max_delay + 1)
+    result = numpy.full((bars, len(pairs), len(lags)), numpy.nan)
+    first = period + max_delay - 1
+
+    series, members = numpy.unique(pairs, return_inverse=True)
+    members = members.reshape(pairs.shape)
+
+    # The later element of each pair runs over the last period bars of the window, the
+    # earlier one over the period bars ending |tau| bars before
+    offsets = numpy.arange(period) - period + 1
+    leading, trailing = numpy.maximum(lags, 0), -numpy.minimum(lags, 0)
+
+    block = max(1, 2**22 // (len(pairs) * len(lags) * period))
+    for start in range(first, bars, block):
+        t = numpy.arange(start, min(start + block, bars))
+
+        # Symbols of the period bars ending at bars t - L .. t of every series, and
+        # their sum c log2 c, shared by all the pairs and delays the series takes part in
+        ends = numpy.arange(start - max_delay, t[-1] + 1)
+        symbols = codes[series[:, None, None], ends[None, :, None] + offsets]
+        if bins is not None:
+            symbols = Information.binned(symbols, bins)
+        groups = symbols.shape[0] * symbols.shape[1]
+        marginal = Information.count_sums(symbols.ravel(), numpy.repeat(numpy.arange(groups), period),
+                                          groups).reshape(symbols.shape[:2])
+
+        # Joint histograms of every pair and delay: (pairs, bars, lags, period) symbols
+        end = (t - ends[0])[None, :, None]
+        x = symbols[members[:, 0, None, None], end - leading]
+        y = symbols[members[:, 1, None, None], end - trailing]
+        k = numpy.max(symbols, initial=0) + 1
+        groups = x.shape[0] * x.shape[1] * x.shape[2]
+        joint = Information.count_sums((x * k + y).ravel(), numpy.repeat(numpy.arange(groups), period),
+                                       groups).reshape(x.shape[:3])
+
+        unlagged = marginal[members[:, 0, None, None], end - leading]
+        lagged = marginal[members[:, 1, None, None], end - trailing]
+        information = numpy.log2(period) + (joint - unlagged - lagged) / period
+        result[t] = information.transpose(1, 0, 2)
+
+    return result
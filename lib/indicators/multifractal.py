@@ -1,9 +1,11 @@
 import numpy
 import pandas
 import matplotlib.pyplot as plt
+from functools import partial
 
 from lib.salib import *
 from lib.utils import preprocess
+from lib.rolling import rolling, measure
 
 
 def mfa(ticker, data_series, period, q_range = (-40, 40), scale_range = (1, 7)):
@@ -78,52 +80,80 @@ def mfa(ticker, data_series, period, q_range = (-40, 40), scale_range = (1, 7)):
     plt.show()
     return results, fig
 
-def mfs_width(data: pandas.Series, length = 2 ** 7, q_range = (-40, 40)):
-
-    N = len(data)
-    df = pandas.DataFrame(index=data.index, columns=["indicator"])
-    print(f"Period = {length}\nData length = {N}\n")
-
-    for t in range(length - 1, N):
-
-        x = data[t - (length - 1):t + 1].values
-
-        l = int(numpy.floor(numpy.log2(len(x))))
-        scale_range = (1, l)
-        q_values = numpy.arange(q_range[0], q_range[1] + 1)
-        scale_values = numpy.arange(scale_range[0], scale_range[1] + 1)
-
-        results = Fractal.fractal_analysis(x, q_values, scale_values)
-        delta_alpha = max(results[0]) - min(results[0])
-        df.loc[df.index[t]] = [*delta_alpha]
-
-        print("t = %d; Multifractal spectrum width = %f" % (t, delta_alpha), end='')
-        print("\t\t\t", end='\r')
-
-    return df
-
-def mfs_height(data: pandas.Series, length = 2 ** 7, q_range = (-40, 40)):
-
-    N = len(data)
-    df = pandas.DataFrame(index=data.index, columns=["indicator"])
-    print(f"Period = {length}\nData length = {N}\n")
-
-    for t in range(length - 1, N):
-
-        x = data[t - (length - 1):t + 1].values
-
-        l = int(numpy.floor(numpy.log2(len(x))))
-        scale_range = (1, l)
-        q_values = numpy.arange(q_range[0], q_range[1] + 1)
-        scale_values = numpy.arange(scale_range[0], scale_range[1] + 1)
-
-        results = Fractal.fractal_analysis(x, q_values, scale_values)
-        amin_index = numpy.where(results[0]==min(results[0]))[0]
-        amax_index = numpy.where(results[0]==max(results[0]))[0]
-        delta_falpha = abs(results[1][amax_index] - results[1][amin_index])
-        df.loc[df.index[t]] = [*delta_falpha]
-
-        print("t = %d; Multifractal spectrum height = %f" % (t, delta_falpha), end='')
-        print("\t\t\t", end='\r')
-
-    return df
\ No newline at end of file
+SPECTRUM = ["width", "height", "alpha_0", "asymmetry", "D_range"]
+
+def _spectra(stack, q_values, scale_values):
+
+    # Consecutive windows cover one span, and every box sum of every window is
+    # gathered from the dyadic partial sums of that span
+    span = numpy.concatenate((stack[0], stack[1:, -1]))
+    P = Fractal.boxes(span, stack.shape[1], scale_values)
+
+    # The (windows, nq, boxes) tensors are built a bounded number of windows at a time
+    result = numpy.empty((len(stack), len(SPECTRUM)))
+    chunk = max(1, 2**18 // (len(q_values) * P.shape[-1]))
+    for start in range(0, len(P), chunk):
+        alpha, falpha, Dq = Fractal.spectrum(P[start:start + chunk], q_values, scale_values)[:3]
+        result[start:start + chunk] = _summary(alpha, falpha, Dq)
+
+    return result
+
+def _grid(length, q_range):
+
+    # Every q in q_range and every dyadic scale of length: the boxes of a scale
+    # have to tile the window exactly
+    l = int(numpy.log2(length)) if length >= 2 else 0
+    if l == 0 or 2**l != length:
+        raise ValueError("The length of the windows has to be a power of two, not %s." % length)
+    return {"q_values": numpy.arange(q_range[0], q_range[1] + 1),
+            "scale_values": numpy.arange(1, l + 1)}
+
+def _summary(alpha, falpha, Dq):
+
+    def _at(values, index):
+        return numpy.take_along_axis(values, index[..., None], axis=-1)[..., 0]
+
+    low, high = numpy.argmin(alpha, axis=-1), numpy.argmax(alpha, axis=-1)
+    alpha_min, alpha_max = _at(alpha, low), _at(alpha, high)
+    alpha_0 = _at(alpha, numpy.argmax(falpha, axis=-1)) # Peak of the spectrum
+
+    with numpy.errstate(all='ignore'):
+        width = alpha_max - alpha_min
+        height = numpy.abs(_at(falpha, high) - _at(falpha, low))
+        asymmetry = ((alpha_0 - alpha_min) - (alpha_max - alpha_0)) / width
+        D_range = Dq[..., 0] - Dq[..., -1]
+
+    return numpy.stack([width, height, alpha_0, asymmetry, D_range], axis=-1)
+
+def mfs(data: pandas.Series, length = 2 ** 7, q_range = (-40, 40), n_jobs: int = 1,
+        progress=None, cache=None, previous=None, dtype=numpy.float64, out=None):
+    """
+    Rolling multifractal spectrum. One Chhabra-Jensen pass per window gives:
+
+      width     -- Δα, spread of the Hölder exponents
+      height    -- Δf(α), |f(α_max) - f(α_min)|
+      alpha_0   -- α at the peak of f(α)
+      asymmetry -- ((α_0 - α_min) - (α_max - α_0)) / Δα, positive when the left
+                   (large fluctuations) branch is wider
+      D_range   -- D(q_min) - D(q_max), spread of the generalized dimensions
+
+    The box sums of every dyadic scale in every window are gathered at once
+    from partial sums of the series built by doubling (see Fractal.boxes).
+    """
+
+    kernel = partial(_spectra, **_grid(length, q_range))
+    return rolling(data, length, kernel, label="Multifractal spectrum", n_jobs=n_jobs,
+                   stacked=True, progress=progress, columns=SPECTRUM, cache=cache,
+                   previous=previous, dtype=dtype, out=out)
+
+def mfs_width(data: pandas.Series, length = 2 ** 7, q_range = (-40, 40), n_jobs: int = 1,
+              progress=None, cache=None, previous=None, dtype=numpy.float64, out=None):
+    return measure(data, partial(_spectra, **_grid(length, q_range)), SPECTRUM.index("width"),
+                   length, "Multifractal spectrum", stacked=True, n_jobs=n_jobs,
+                   progress=progress, cache=cache, previous=previous, dtype=dtype, out=out)
+
+def mfs_height(data: pandas.Series, length = 2 ** 7, q_range = (-40, 40), n_jobs: int = 1,
+               progress=None, cache=None, previous=None, dtype=numpy.float64, out=None):
+    return measure(data, partial(_spectra, **_grid(length, q_range)), SPECTRUM.index("height"),
+                   length, "Multifractal spectrum", stacked=True, n_jobs=n_jobs,
+                   progress=progress, cache=cache, previous=previous, dtype=dtype, out=out)
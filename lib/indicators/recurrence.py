@@ -1,5 +1,5 @@
+import numpy
 import pandas
-from scipy.spatial.distance import pdist, squareform
 
 from pyrqa.time_series import TimeSeries
 from pyrqa.settings import Settings
@@ -9,89 +9,162 @@ from pyrqa.metric import EuclideanMetric
 from pyrqa.computation import RQAComputation, RPComputation
 from pyrqa.image_generator import ImageGenerator
 
+from lib.rolling import rolling, replay, measure
+from lib.streaming import Recurrence
+
+
+MEASURES = ["RR", "DET", "LAM", "L_max", "L_entr", "TT"]
+
+def _rqa(x):
+
+    reconstructed = TimeSeries(x, embedding_dimension=2, time_delay=2)
+    settings = Settings(reconstructed,
+                        analysis_type=Classic,
+                        neighbourhood=FixedRadius(0.65),
+                        similarity_measure=EuclideanMetric,
+                        theiler_corrector=1)
+    computation = RQAComputation.create(settings, verbose=False)
+    result = computation.run()
+
+    return [result.recurrence_rate, result.determinism, result.laminarity,
+            result.longest_diagonal_line, result.entropy_diagonal_lines, result.trapping_time]
+
+def rqa(data: pandas.Series, period: int, incremental: bool = False, n_jobs: int = 1,
+        progress=None, cache=None, previous=None, dtype=numpy.float64, out=None):
+    """
+    Rolling recurrence quantification analysis. Every window is embedded and
+    its recurrence matrix analysed once, and all measures come from that pass:
+
+      RR     -- recurrence rate
+      DET    -- determinism
+      LAM    -- laminarity
+      L_max  -- longest diagonal line
+      L_entr -- Shannon entropy of the diagonal line lengths
+      TT     -- trapping time
+
+    Incremental mode skips pyrqa and slides a NumPy recurrence matrix instead,
+    computing only the distances of the entering point and updating the line
+    histograms in O(period) per bar (see lib.streaming.Recurrence).
+    """
+
+    if incremental:
+        return replay(data, Recurrence(period, radius=0.65, dimension=2, delay=2), label="RQA",
+                      n_jobs=n_jobs, progress=progress, columns=MEASURES, cache=cache,
+                      previous=previous, dtype=dtype, out=out)
+    return rolling(data, period, _rqa, label="RQA", n_jobs=n_jobs, progress=progress,
+                   columns=MEASURES, cache=cache, previous=previous, dtype=dtype, out=out)
+
+def _engine(period, incremental):
+    return Recurrence(period, radius=0.65, dimension=2, delay=2) if incremental else _rqa
+
+def rate(data: pandas.Series, period: int, incremental: bool = False, n_jobs: int = 1,
+         progress=None, cache=None, previous=None, dtype=numpy.float64, out=None):
+    return measure(data, _engine(period, incremental), MEASURES.index("RR"), period, "RQA",
+                   n_jobs=n_jobs, progress=progress, cache=cache, previous=previous, dtype=dtype,
+                   out=out)
+
+def determinism(data: pandas.Series, period: int, incremental: bool = False, n_jobs: int = 1,
+                progress=None, cache=None, previous=None, dtype=numpy.float64, out=None):
+    return measure(data, _engine(period, incremental), MEASURES.index("DET"), period, "RQA",
+                   n_jobs=n_jobs, progress=progress, cache=cache, previous=previous, dtype=dtype,
+                   out=out)
+
+def laminarity(data: pandas.Series, period: int, incremental: bool = False, n_jobs: int = 1,
+               progress=None, cache=None, previous=None, dtype=numpy.float64, out=None):
+    return measure(data, _engine(period, incremental), MEASURES.index("LAM"), period, "RQA",
+                   n_jobs=n_jobs, progress=progress, cache=cache, previous=previous, dtype=dtype,
+                   out=out)
+
+def recurrence_plot(series, eps=0.10, steps=10, threshold: bool = False, packed: bool = False,
+                    dtype=numpy.float64, path: str = None, tile: int = 2048):
+    """
+    Recurrence plot of a 1-D series, computed tile by tile so memory stays
+    bounded by tile**2 values besides the output itself.
+
+    Input:
+      series    -- 1-D array
+      eps       -- width of the distance levels
+      steps     -- level the larger distances are clipped to
+      threshold -- boolean recurrence matrix (distance below eps) instead of levels
+      packed    -- with threshold, pack every row 8 points per byte (numpy.packbits)
+      dtype     -- dtype of the levels, numpy.uint8 takes an eighth of float64
+      path      -- .npy file backing the output as a memory map, for series too
+                   long for the plot to fit in memory
+      tile      -- rows and columns computed at a time
+
+    Output:
+      (N, N) levels or booleans, (N, ceil(N / 8)) uint8 if packed
+    """
+
+    x = numpy.asarray(series, dtype=numpy.float64)
+    N = len(x)
+
+    if packed and not threshold:
+        raise ValueError("Only thresholded plots can be packed.")
+
+    if packed:
+        shape, dtype = (N, (N + 7) // 8), numpy.uint8
+        tile = max(8, tile - tile % 8) # Column tiles start on byte boundaries
+    else:
+        shape, dtype = (N, N), bool if threshold else dtype
+
+    if path is None:
+        Z = numpy.empty(shape, dtype=dtype)
+    else:
+        Z = numpy.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+
+    for i in range(0, N, tile):
+        # The plot is symmetric: unpacked tiles are mirrored below the diagonal
+        for j in range(0 if packed else i, N, tile):
+            block = _levels(x[i:i + tile], x[j:j + tile], eps, steps, threshold)
+            if packed:
+                block = numpy.packbits(block, axis=1)
+                Z[i:i + tile, j // 8:j // 8 + block.shape[1]] = block
+            else:
+                Z[i:i + tile, j:j + tile] = block
+                Z[j:j + tile, i:i + tile] = block.T
+
+    if path is not None:
+        Z.flush()
+    return Z
 
-def rate(data: pandas.Series, period: int):
-
-    N = len(data)
-    df = pandas.DataFrame(index=data.index, columns=["indicator"])
-    print(f"Period = {period}\nData length = {N}\n")
-
-    for t in range(period - 1, N):
-
-        x = data[t - (period - 1):t + 1].values
-
-        # RQA Analysis
-        reconstructed = TimeSeries(x, embedding_dimension=2, time_delay=2)
-        settings = Settings(reconstructed, analysis_type=Classic,
-                            neighbourhood=FixedRadius(0.65),
-                            similarity_measure=EuclideanMetric, theiler_corrector=1)
-        computation = RQAComputation.create(settings, verbose=False)
-        result = computation.run()
-        RR = result.recurrence_rate
-        df.loc[df.index[t]] = [RR]
-
-        print("t = %d; RR = %f" % (t, RR), end='')
-        print("\t\t\t", end='\r')
-
-    return df
-
-def determinism(data: pandas.Series, period: int):
-
-    N = len(data)
-    df = pandas.DataFrame(index=data.index, columns=["indicator"])
-    print(f"Period = {period}\nData length = {N}\n")
-
-    for t in range(period - 1, N):
-
-        x = data[t - (period - 1):t + 1].values
-
-        # RQA Analysis
-        reconstructed = TimeSeries(x, embedding_dimension=2, time_delay=2)
-        settings = Settings(reconstructed,
-                            analysis_type=Classic,
-                            neighbourhood=FixedRadius(0.65),
-                            similarity_measure=EuclideanMetric,
-                            theiler_corrector=1)
-        computation = RQAComputation.create(settings, verbose=False)
-        result = computation.run()
-        DET = result.determinism
-        df.loc[df.index[t]] = [DET]
-
-        print("t = %d; DET = %f" % (t, DET), end='')
-        print("\t\t\t", end='\r')
-    return df
-
-def laminarity(data: pandas.Series, period: int):
-
-    N = len(data)
-    df = pandas.DataFrame(index=data.index, columns=["indicator"])
-    print(f"Period = {period}\nData length = {N}\n")
-
-    for t in range(period - 1, N):
-
-        x = data[t - (period - 1):t + 1].values
-
-        # RQA Analysis
-        reconstructed = TimeSeries(x, embedding_dimension=2, time_delay=2)
-        settings = Settings(reconstructed,
-                            analysis_type=Classic,
-                            neighbourhood=FixedRadius(0.65),
-                            similarity_measure=EuclideanMetric,
-                            theiler_corrector=1)
-        computation = RQAComputation.create(settings, verbose=False)
-        result = computation.run()
-        LAM = result.laminarity
-
-        df.loc[df.index[t]] = [LAM]
-
-        print("t = %d; LAM = %f" % (t, LAM), end='')
-        print("\t\t\t", end='\r')
-        return df
-
-def recurrence_plot(series, eps=0.10, steps=10):
-
-    d = pdist(series[:, None])
-    d = numpy.floor(d / eps)
+def recurrence_image(series, eps=0.10, steps=10, threshold: bool = False, size: int = 1000,
+                     tile: int = 2048):
+    """
+    Downsampled recurrence plot for rendering long series: pixel (p, q) is
+    the mean level (or recurrence rate, with threshold) over the block of
+    ceil(N / size) points square it covers. Computed tile by tile without
+    materialising the plot.
+    """
+
+    x = numpy.asarray(series, dtype=numpy.float64)
+    N = len(x)
+    block = -(-N // size)
+    pixels = numpy.arange(N) // block
+
+    counts = numpy.bincount(pixels).astype(numpy.float64)
+    image = numpy.zeros((len(counts), len(counts)))
+
+    for i in range(0, N, tile):
+        rows = pixels[i:i + tile]
+        row_starts = numpy.flatnonzero(numpy.diff(rows, prepend=-1))
+        for j in range(i, N, tile):
+            columns = pixels[j:j + tile]
+            column_starts = numpy.flatnonzero(numpy.diff(columns, prepend=-1))
+
+            levels = _levels(x[i:i + tile], x[j:j + tile], eps, steps, threshold)
+            sums = numpy.add.reduceat(numpy.add.reduceat(levels, row_starts, axis=0, dtype=numpy.float64),
+                                      column_starts, axis=1)
+            image[rows[0]:rows[-1] + 1, columns[0]:columns[-1] + 1] += sums
+            if j != i: # Mirrored tile
+                image[columns[0]:columns[-1] + 1, rows[0]:rows[-1] + 1] += sums.T
+
+    return image / numpy.outer(counts, counts)
+
+def _levels(x, y, eps, steps, threshold):
+
+    d = numpy.floor(numpy.abs(x[:, None] - y[None, :]) / eps)
+    if threshold:
+        return d < 1
     d[d>steps] = steps
-    Z = squareform(d)
-    return Z
+    return d
@@ -0,0 +1,114 @@
+"""
+Memory-mapped inputs and outputs for the rolling indicators.
+
+Histories larger than memory are opened as memory maps and wrapped in a
+pandas.Series without copying. lib.rolling then reads them, and writes
+results to a memory-mapped out=, a chunk of bars at a time (see
+lib.rolling.CHUNK), with each chunk led by the period - 1 bars its first
+windows need. Peak memory is then bounded by the chunk and by what an
+indicator holds per chunk, whatever the history length; the one-measure
+indicators (mfs_width, rate, ...) compute only their own column for that:
+
+  close = load("btc_minutes.npy", "close")
+  entropy = shen(close, 60, out=output("shen_60.npy", len(close)))
+"""
+
+import os
+import numpy
+import pandas
+
+
+def load(path: str, column: str = None, index: str = None):
+    """
+    Memory-mapped pandas.Series of one column of a history.
+
+    Input:
+      path   -- NPY file (1-D, or structured with one field per column), directory
+                of one NPY file per column (close.npy, ...), or uncompressed Arrow
+                IPC (Feather) file written as a single record batch
+      column -- column name, None for a 1-D NPY file
+      index  -- column of timestamps to index the series with (read into memory),
+                a RangeIndex if None
+
+    Parquet files are encoded and cannot be mapped: convert them once with to_npy.
+    """
+
+    values = _column(path, column)
+    if index is None:
+        labels = pandas.RangeIndex(len(values))
+    else:
+        labels = pandas.Index(numpy.asarray(_column(path, index)))
+
+    return pandas.Series(values, index=labels, name=column, copy=False)
+
+
+def output(path: str, length: int, width: int = 1, dtype=numpy.float64):
+    """
+    Memory-mapped NPY file of length (by width) NaN values, to pass as out= to
+    an indicator. numpy.load(path, mmap_mode="r") opens it again later.
+    """
+
+    shape = (length,) if width == 1 else (length, width)
+    out = numpy.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+    out[...] = numpy.nan
+    return out
+
+
+def to_npy(path: str, directory: str, columns: list = None, batch: int = 2**20):
+    """
+    Write the columns (all if None) of a Parquet or Arrow IPC file to one NPY
+    file each in directory, a batch of rows at a time, for load to map.
+    """
+
+    import pyarrow.dataset
+
+    source = pyarrow.dataset.dataset(path, format="parquet" if path.endswith(".parquet") else "ipc")
+    columns = source.schema.names if columns is None else list(columns)
+    rows = source.count_rows()
+
+    os.makedirs(directory, exist_ok=True)
+    files = {}
+    for name in columns:
+        dtype = source.schema.field(name).type.to_pandas_dtype()
+        files[name] = numpy.lib.format.open_memmap(os.path.join(directory, name + ".npy"),
+                                                   mode="w+", dtype=dtype, shape=(rows,))
+
+    start = 0
+    for record in source.to_batches(columns=columns, batch_size=batch):
+        for name in columns:
+            files[name][start:start + record.num_rows] = record.column(name).to_numpy(
+                zero_copy_only=False)
+        start += record.num_rows
+
+    for array in files.values():
+        array.flush()
+
+
+def _column(path, column):
+
+    if os.path.isdir(path):
+        return numpy.load(os.path.join(path, column + ".npy"), mmap_mode="r")
+
+    if path.endswith(".npy"):
+        array = numpy.load(path, mmap_mode="r")
+        if column is None:
+            if array.ndim != 1 or array.dtype.names is not None:
+                raise ValueError("Choose a column.")
+            return array
+        if array.dtype.names is None or column not in array.dtype.names:
+            raise ValueError("No column %s in %s." % (column, path))
+        return array[column]
+
+    if path.endswith(".parquet"):
+        raise ValueError("Parquet files cannot be memory-mapped, convert them with to_npy.")
+
+    import pyarrow
+    import pyarrow.ipc
+
+    # Buffers of an uncompressed file point into the map, so the arrays are views
+    table = pyarrow.ipc.open_file(pyarrow.memory_map(path, "r")).read_all()
+    chunks = table.column(column).chunks
+    if len(chunks) != 1 or chunks[0].null_count:
+        raise ValueError("Only single-batch columns without nulls can be mapped, convert "
+                         "the file with to_npy.")
+    return chunks[0].to_numpy(zero_copy_only=True)
@@ -0,0 +1,81 @@
+import sys
+import time
+from contextlib import contextmanager
+
+
+class Progress:
+    """
+    Throttled progress reporter for the rolling indicators.
+
+    Pass an instance as progress= to an indicator (or to lib.rolling directly);
+    without one the indicators run silently. At most once every interval
+    seconds, and once when the run finishes, callback receives a report:
+
+      name    -- indicator label
+      done    -- bars computed so far
+      total   -- bars to compute
+      rate    -- bars per second
+      eta     -- estimated seconds left
+      elapsed -- seconds since start
+      stages  -- seconds spent in each named stage (prepare, compute, ...)
+
+    The default callback writes a single refreshing line to stderr, so the
+    report can also be sent to a metrics system instead of the terminal.
+    """
+
+    def __init__(self, callback=None, interval: float = 1.0):
+
+        self.callback = callback if callback is not None else _write
+        self.interval = interval
+        self.start()
+
+    def start(self, name: str = None, total: int = 0):
+
+        self.name, self.total, self.done = name, total, 0
+        self.stages = {}
+        self.began = self.last = time.perf_counter()
+
+    def advance(self, bars: int = 1):
+
+        self.done += bars
+        now = time.perf_counter()
+        if now - self.last >= self.interval:
+            self.last = now
+            self.callback(self.report())
+
+    def finish(self):
+        self.callback(self.report())
+
+    @contextmanager
+    def stage(self, name: str):
+
+        began = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.) + time.perf_counter() - began
+
+    def report(self):
+
+        elapsed = time.perf_counter() - self.began
+        rate = self.done / elapsed if elapsed > 0 else 0.
+        eta = (self.total - self.done) / rate if rate > 0 else float("nan")
+
+        return {"name": self.name, "done": self.done, "total": self.total, "rate": rate,
+                "eta": eta, "elapsed": elapsed, "stages": dict(self.stages)}
+
+
+def reporter(progress):
+    """ Progress instance for a progress= argument: None, a Progress, or a callback. """
+
+    if progress is None or isinstance(progress, Progress):
+        return progress
+    return Progress(progress)
+
+
+def _write(report):
+
+    end = '\n' if report["done"] >= report["total"] else '\r'
+    print("%s: %d/%d bars; %.0f bars/s; ETA %.1f s" % (report["name"], report["done"], report["total"],
+                                                     report["rate"], report["eta"]),
+          end=end, file=sys.stderr)
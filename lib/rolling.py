@@ -0,0 +1,405 @@
+import os
+import multiprocessing
+import numpy
+import pandas
+from functools import partial
+from contextlib import nullcontext
+from numpy.lib.stride_tricks import sliding_window_view
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from lib.cache import fingerprint
+from lib.progress import reporter
+
+CHUNK = 2**20 # Bars a serial run computes at a time, bounding its temporary memory
+
+
+def windows(values, period: int):
+    """
+    Zero-copy (len(values) - period + 1, period) view of every window in values.
+    Row k is the window ending at position k + period - 1.
+    """
+
+    values = numpy.ascontiguousarray(values, dtype=numpy.float64)
+    if len(values) < period:
+        return numpy.empty((0, period))
+    return sliding_window_view(values, period)
+
+
+def rolling(data: pandas.Series, period: int, kernel, label: str = None, n_jobs: int = 1,
+            stacked: bool = False, progress=None, columns: list = None, cache=None,
+            previous=None, dtype=numpy.float64, out=None):
+    """
+    Apply kernel to every window of length period in data.
+
+    Input:
+      data     -- pandas.Series
+      period   -- window length
+      kernel   -- callable mapping a window (read-only numpy view) to a float,
+                  it has to be picklable (module-level or functools.partial) when n_jobs > 1
+      label    -- indicator name used in progress reports
+      n_jobs   -- number of worker processes, -1 for one per CPU
+      stacked  -- kernel maps a (windows, period) stack to an array of values instead,
+                  it is called on chunks of about a million values
+      progress -- lib.progress.Progress or callback receiving its reports, silent if None
+      columns  -- names of the values when kernel returns several per window
+      cache    -- lib.cache.Cache reusing the results of earlier runs on the same bars,
+                  the kernel has to be picklable
+      previous -- result of an earlier run on the start of data, extended by computing
+                  only the windows ending at the new bars (see _overlap)
+      dtype    -- dtype of the result, numpy.float32 halves its memory (windows are
+                  still computed in float64)
+      out      -- preallocated (N,) or (N, len(columns)) array, e.g. a column of a Block,
+                  that receives the result and backs the returned frame; its dtype
+                  overrides dtype
+
+    Output:
+      pandas.Series of dtype (pandas.DataFrame if columns are given), NaN during
+      the warm-up bars. Its attrs["fingerprint"] identifies the bars it was computed on.
+    """
+
+    width = 1 if columns is None else len(columns)
+    dtype = numpy.dtype(dtype if out is None else out.dtype)
+    key = None if cache is None else cache.key("rolling", kernel, period, stacked, columns,
+                                               dtype.str)
+    return _run(data, _sweep, period, period - 1, n_jobs, (kernel, stacked, width), label,
+                progress, columns, cache, key, previous, dtype, out)
+
+
+def replay(data: pandas.Series, stream, label: str = None, n_jobs: int = 1, progress=None,
+           columns: list = None, cache=None, previous=None, dtype=numpy.float64, out=None):
+    """
+    Feed data bar by bar to a streaming indicator (see lib.streaming).
+
+    Input:
+      data     -- pandas.Series
+      stream   -- object whose update(x) returns the indicator for the window
+                  ending at x, NaN while it is warming up
+      label    -- indicator name used in progress reports
+      n_jobs   -- number of worker processes, -1 for one per CPU. Every worker
+                  gets a fresh copy of stream and warms it up on the period - 1
+                  bars preceding its chunk.
+      progress -- lib.progress.Progress or callback receiving its reports, silent if None
+      columns  -- names of the values when update returns several per bar
+      cache    -- lib.cache.Cache reusing the results of earlier runs on the same bars,
+                  new bars are fed to a fresh stream warmed up like a worker's
+      previous -- result of an earlier run on the start of data, extended by feeding
+                  only the new bars to a fresh stream warmed up like a worker's
+      dtype    -- dtype of the result, as for rolling
+      out      -- preallocated array receiving the result, as for rolling
+
+    Output:
+      pandas.Series of dtype (pandas.DataFrame if columns are given), with the
+      attrs["fingerprint"] of the bars it was computed on
+    """
+
+    # Keyed on the stream before it is fed: its parameters and initial state
+    width = 1 if columns is None else len(columns)
+    dtype = numpy.dtype(dtype if out is None else out.dtype)
+    key = None if cache is None else cache.key("replay", stream, columns, dtype.str)
+    return _run(data, _feed, stream.period, 0, n_jobs, (stream, width), label, progress,
+                columns, cache, key, previous, dtype, out)
+
+
+def _run(data, function, period, first, n_jobs, task, label, progress, columns, cache, key,
+         previous, dtype, out):
+
+    progress = reporter(progress)
+    if progress is not None:
+        progress.start(label, max(len(data) - first, 0))
+
+    # Float arrays, memory maps included, are converted to float64 a chunk at a time
+    with _stage(progress, "prepare"):
+        values = data.values
+        if not isinstance(values, numpy.ndarray) or values.dtype.kind != "f":
+            values = numpy.asarray(values, dtype=numpy.float64)
+
+    # Known bars are taken over and only the windows ending after them are computed.
+    # The last bar of a previous result is recomputed as a check. A previous result
+    # may lack some columns, so it is never cached.
+    done, known, positions = 0, None, slice(None)
+    if previous is not None:
+        with _stage(progress, "prepare"):
+            done, known, positions = _overlap(previous, data, values, columns)
+        start = max(first, done - 1)
+    else:
+        if cache is not None:
+            with _stage(progress, "cache"):
+                done, known = cache.lookup(key, values, data.index)
+        start = max(first, done)
+    if progress is not None:
+        progress.total = max(len(data) - start, 0)
+
+    with _stage(progress, "compute"):
+        width = 1 if columns is None else len(columns)
+        result = _parallel(function, values, period, start, n_jobs, task, progress, width,
+                           dtype, out)
+        block = result.reshape(len(result), -1)
+
+        # Within rounding of the coarser of the result and previous dtypes
+        if previous is not None and first < done:
+            resolution = max(numpy.finfo(dtype).resolution, numpy.finfo(known.dtype).resolution)
+            rtol = max(1e-9, 10 * resolution)
+            if not numpy.allclose(block[done - 1, positions], known[-1], rtol=rtol, atol=1e-12,
+                                  equal_nan=True):
+                raise ValueError("The previous result does not match the data.")
+        if done:
+            block[:done, positions] = known.reshape(done, -1)
+
+    with _stage(progress, "assemble"):
+        if columns is None:
+            series = pandas.Series(result, index=data.index, name="indicator", copy=False)
+        else:
+            series = pandas.DataFrame(result, index=data.index, columns=columns, copy=False)
+        series.attrs["fingerprint"] = fingerprint(values, data.index)
+
+    if cache is not None and previous is None and done < len(data):
+        with _stage(progress, "cache"):
+            cache.store(key, values, data.index, result, extended=done)
+
+    if progress is not None:
+        progress.finish()
+    return series
+
+
+def _overlap(previous, data, values, columns):
+    """
+    Bars covered by a previous result (pandas.Series or pandas.DataFrame) of the
+    same computation on the start of data, their values and the positions of
+    their columns among columns. A one-column result matches a one-value
+    indicator whatever its name. ValueError is raised unless the data still
+    starts with the bars the previous result was computed on: its timestamps
+    have to match, and so does the fingerprint it carries in attrs. Without
+    a fingerprint (pandas drops attrs when a result is copied into another
+    frame) the bars cannot be checked, and ValueError is raised as well.
+    """
+
+    done = len(previous)
+    if done > len(data) or not previous.index.equals(data.index[:done]):
+        raise ValueError("The previous result does not cover the start of the data.")
+
+    digest = previous.attrs.get("fingerprint")
+    if digest is None:
+        raise ValueError("The previous result has no fingerprint of its bars: pass the result "
+                         "an indicator returned, or set its attrs['fingerprint'] with "
+                         "lib.cache.fingerprint(bars, timestamps).")
+    if digest != fingerprint(values[:done], data.index[:done]):
+        raise ValueError("The data before the new bars has changed.")
+
+    names = list(previous.columns) if isinstance(previous, pandas.DataFrame) else [previous.name]
+    if columns is None or len(columns) == 1:
+        positions = [0] if len(names) == 1 else None
+    else:
+        positions = [list(columns).index(name) for name in names if name in columns]
+    if positions is None or len(positions) != len(names):
+        raise ValueError("The previous result has other columns.")
+
+    known = numpy.asarray(previous)
+    if known.dtype.kind != "f":
+        known = known.astype(numpy.float64)
+    return done, known, positions
+
+
+def pick(function, position: int):
+    """
+    Kernel (see rolling) or stream (see replay) returning only the value at
+    position among those function returns per window, row of a stack or bar,
+    so that a one-column indicator derived from a multi-column one computes
+    and stores that column alone, a chunk at a time.
+    """
+
+    if hasattr(function, "update"):
+        return _Picked(function, position)
+    return partial(_pick, function, position)
+
+
+def _pick(kernel, position, x):
+    return numpy.asarray(kernel(x))[..., position]
+
+
+def measure(data: pandas.Series, function, position: int, period: int = None,
+            label: str = None, **options):
+    """
+    One of the values a kernel (see rolling, over windows of period) or a
+    stream (see replay) returns, as a one-column indicator frame. Only that
+    value is computed and stored, so out receives it a chunk at a time.
+    options are passed on to rolling or replay (n_jobs, cache, previous, ...).
+    """
+
+    function = pick(function, position)
+    if isinstance(function, _Picked):
+        return replay(data, function, label, columns=["indicator"], **options)
+    return rolling(data, period, function, label, columns=["indicator"], **options)
+
+
+class _Picked:
+
+    def __init__(self, stream, position):
+        self.stream, self.position = stream, position
+        self.period = stream.period
+
+    def update(self, x):
+        value = self.stream.update(x)
+        return value if numpy.ndim(value) == 0 else value[self.position] # NaN while warming up
+
+
+class Block:
+    """
+    Preallocated NaN-filled block of indicator results sharing one index, so
+    that several indicators fill a single compact frame instead of allocating
+    one each:
+
+      block = Block(data.index, ["entropy", "width"], dtype=numpy.float32)
+      shen(data, 50, out=block["entropy"])
+      mfs_width(data, out=block["width"])
+      frame = block.frame()
+
+    The columns are contiguous (column-major storage), and the frame wraps the
+    block without copying it.
+    """
+
+    def __init__(self, index, columns: list, dtype=numpy.float64):
+
+        self.index = index
+        self.columns = list(columns)
+        self.values = numpy.full((len(self.columns), len(index)), numpy.nan, dtype=dtype).T
+
+    def __getitem__(self, column):
+        return self.values[:, self.columns.index(column)]
+
+    def frame(self):
+        return pandas.DataFrame(self.values, index=self.index, columns=self.columns, copy=False)
+
+
+def _stage(progress, name):
+    return nullcontext() if progress is None else progress.stage(name)
+
+
+def _sweep(values, period, task, progress):
+
+    kernel, stacked, width = task
+    stack = windows(values, period)
+    result = numpy.empty((len(stack),) if width == 1 else (len(stack), width))
+
+    if stacked:
+        chunk = max(1, 2**20 // period)
+        for start in range(0, len(stack), chunk):
+            result[start:start + chunk] = kernel(stack[start:start + chunk])
+            if progress is not None:
+                progress.advance(len(result[start:start + chunk]))
+        return result
+
+    for k, x in enumerate(stack):
+        result[k] = kernel(x)
+        if progress is not None:
+            progress.advance()
+
+    return result
+
+
+def _feed(values, period, task, progress):
+
+    stream, width = task
+    values = numpy.asarray(values, dtype=numpy.float64)
+    result = numpy.empty((len(values),) if width == 1 else (len(values), width))
+
+    for k, x in enumerate(values):
+        result[k] = stream.update(x)
+        if progress is not None:
+            progress.advance()
+
+    return result
+
+
+def _parallel(function, values, period, first, n_jobs, task, progress, width=1,
+              dtype=numpy.float64, out=None):
+    """
+    Fill the bars [first, N) by running function over values, serially or on a
+    process pool. Each chunk of bars [start, stop) is shipped together with the
+    period - 1 bars before it, so a worker sees exactly the windows of a serial
+    run, and the results are stitched back in order. Progress is advanced as
+    chunks complete. The result is allocated with dtype unless out is given.
+
+    Chunks span at most CHUNK bars, so values and out can be memory maps of
+    any length: only a chunk of them is held in memory at a time. A serial run
+    feeds its chunks to the same stream one after the other.
+    """
+
+    N = len(values)
+    shape = (N,) if width == 1 else (N, width)
+    if out is None:
+        result = numpy.empty(shape, dtype=dtype)
+    elif out.shape == shape:
+        result = out
+    else:
+        raise ValueError("The output array does not fit the result.")
+    result[...] = numpy.nan
+
+    n_jobs = workers(n_jobs)
+
+    if first >= N:
+        return result
+
+    if n_jobs == 1:
+        for start in range(first, N, CHUNK):
+            stop = min(start + CHUNK, N)
+            lead = max(start - (period - 1), 0)
+            if function is _feed:
+                # The stream is warmed up once, outside the progress reports,
+                # and has seen the bars before every later chunk
+                if start == first:
+                    function(values[lead:start], period, task, None)
+                lead = start
+            part = function(values[lead:stop], period, task, progress)
+            result[start:stop] = part[-(stop - start):]
+        return result
+
+    chunks = max(4 * n_jobs, -(-(N - first) // CHUNK))
+    bounds = numpy.unique(numpy.linspace(first, N, chunks + 1).astype(int))
+    spans = list(zip(bounds[:-1], bounds[1:]))
+
+    def _store(k, part):
+        start, stop = spans[k]
+        result[start:stop] = part[-(stop - start):]
+        if progress is not None:
+            progress.advance(stop - start)
+
+    tasks = [(values[max(start - (period - 1), 0):stop], period, task, None)
+             for start, stop in spans]
+    execute(function, tasks, n_jobs, _store)
+
+    return result
+
+
+def workers(n_jobs: int):
+    """ Number of worker processes n_jobs stands for, -1 meaning one per CPU. """
+    return os.cpu_count() if n_jobs == -1 else n_jobs
+
+
+def execute(function, tasks: list, n_jobs: int, collect):
+    """
+    Call function(*arguments) for every tuple of arguments in tasks, in this
+    process if n_jobs is 1 and otherwise on a pool of n_jobs worker processes
+    (-1 for one per CPU), and pass the position of each task and its result to
+    collect as soon as it is done. The first exception raised by a task
+    cancels the tasks not started yet and is raised again here.
+    """
+
+    n_jobs = workers(n_jobs)
+    if n_jobs == 1:
+        for k, arguments in enumerate(tasks):
+            collect(k, function(*arguments))
+        return
+
+    # Spawned rather than forked workers: forking after OpenCL (pyrqa) has been
+    # initialised in the parent deadlocks the children
+    context = multiprocessing.get_context("spawn")
+
+    with ProcessPoolExecutor(max_workers=n_jobs, mp_context=context) as executor:
+        futures = {executor.submit(function, *arguments): k for k, arguments in enumerate(tasks)}
+        try:
+            # Popped so that finished results are released as soon as they are collected
+            for future in as_completed(futures):
+                collect(futures.pop(future), future.result())
+        except BaseException:
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
@@ -1,62 +1,71 @@
 import numpy
-from scipy import stats
-from pyinform import mutual_info
+from numpy.lib.stride_tricks import sliding_window_view
 import matplotlib.pyplot
 
 
 class Chaos:
 
-    def lyapunov_exponent(time_series, candle_range=100, initial_diameter=0.001, display=False):
+    def lyapunov_exponent(time_series, candle_range=100, initial_diameter=0.001, display=False, distances=None):
 
-        time_series, N = numpy.array(time_series), candle_range
+        time_series = numpy.array(time_series, dtype=float)[:candle_range]
+        N = len(time_series)
         #time_series = (time_series - np.mean(time_series)) / np.std(time_series) # standardization
 
-        exponents = [[] for i in range(N)]
+        # Pairs (i, j), i < j, starting closer than the initial diameter
+        if distances is None:
+            distances = numpy.abs(time_series[:, None] - time_series[None, :])
+        distances = distances[:N, :N]
+        I, J = numpy.nonzero(numpy.triu(distances < initial_diameter, k=1))
 
-        for i in range(N):
-            for j in range(i + 1, N):
+        # Divergence curve: the pair (i, j) contributes ln|x[i+k] - x[j+k]| to step k
+        # for every k < N - j, i.e. the tail of its diagonal in the distance matrix.
+        # The gathers are chunked over pairs to bound memory.
+        sums, counts = numpy.zeros(N), numpy.zeros(N)
+        chunk = max(1, 2**22 // max(N, 1))
 
-                if numpy.abs(time_series[i] - time_series[j]) < initial_diameter:
+        for start in range(0, len(I), chunk):
 
-                    for k in range(min(N - i, N - j)):
+            i, j = I[start:start + chunk], J[start:start + chunk]
+            lengths = N - j
+            pair = numpy.repeat(numpy.arange(len(i)), lengths)
+            k = numpy.arange(len(pair)) - numpy.repeat(numpy.cumsum(lengths) - lengths, lengths)
 
-                        d = numpy.abs(time_series[i+k] - time_series[j+k])
+            d = distances[i[pair] + k, j[pair] + k]
+            valid = (d != 0.) & ~numpy.isnan(d) # Avoid zero differences
 
-                        if d == 0. or numpy.isnan(d): continue # Avoid zero differences
-                        else: pass
+            sums += numpy.bincount(k[valid], weights=numpy.log(d[valid]), minlength=N)
+            counts += numpy.bincount(k[valid], minlength=N)
 
-                        exponents[k].append(numpy.log(d))
+        x = numpy.flatnonzero(counts).astype(float)
+        y = sums[counts > 0] / counts[counts > 0]
 
-        lyapunovs = []
-        for i in range(len(exponents)):
-            if len(exponents[i]):
-                lyapunovs.append([i, numpy.mean(exponents[i])])
+        if x.size < 2:
+            return numpy.nan
 
 
-        # Linear regression
+        # Linear regression over every prefix x[:cut] at once from cumulative sums.
+        # We need to start from 3 to avoid R^2=1 at the beginning
+        cuts = numpy.arange(min(3, x.size), x.size + 1)
+        dx, dy = x - x[0], y - y[0] # Shifted to the first point to limit cancellation
 
-        x = numpy.array(lyapunovs)[:,0]
-        y = numpy.array(lyapunovs)[:,1]
+        n = cuts
+        Sx, Sy = numpy.cumsum(dx)[cuts - 1], numpy.cumsum(dy)[cuts - 1]
+        Sxx, Syy = numpy.cumsum(dx * dx)[cuts - 1], numpy.cumsum(dy * dy)[cuts - 1]
+        Sxy = numpy.cumsum(dx * dy)[cuts - 1]
 
-        results = []
-        cut = 2 # We need to start from 3 to avoid R^2=1 at the beginning
-        for i in range(x.size):
+        ssx, ssy, sxy = Sxx - Sx * Sx / n, Syy - Sy * Sy / n, Sxy - Sx * Sy / n
+        slopes = sxy / ssx
+        intercepts = y[0] + (Sy - slopes * Sx) / n - slopes * x[0]
 
-            cut += 1
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            r_sqrs = numpy.where(ssy > 0, numpy.minimum(sxy * sxy / (ssx * ssy), 1.), 0.)
 
-            X = x[:cut]
-            Y = y[:cut]
-
-            slope, intercept, r, p, se = stats.linregress(X, Y)
-            results.append((slope, intercept, cut, r**2))
-
-        results_T = list(zip(*results))
-        r_sqr = max(results_T[3])
-        i = results_T[3].index(r_sqr)
-        lyapunov_exp = results[i][0] # Slope is the Lyapunov exponent
-        intercept = results[i][1]
-        cut = results[i][2]
-        X = X[:cut]
+        i = numpy.argmax(r_sqrs)
+        r_sqr = r_sqrs[i]
+        lyapunov_exp = slopes[i] # Slope is the Lyapunov exponent
+        intercept = intercepts[i]
+        cut = cuts[i]
+        X = x[:cut]
 
         if display:
             print("Linear regime: [0, %d], R-square = %.3f\n\nLyapunov exponent = %.3f\n" % (cut, r_sqr, lyapunov_exp))
@@ -95,38 +104,193 @@ class Entropy:
 
     def shannon(series):
 
-        pk = series / numpy.sum(series)
-        return -numpy.sum(pk * numpy.log2(pk))
+        # Along the last axis, so a stack of windows is handled in one call
+        pk = series / numpy.sum(series, axis=-1, keepdims=True)
+        return -numpy.sum(pk * numpy.log2(pk), axis=-1)
 
-    def approximate(U, m, r):
+    def templates(U, m, r):
+        """
+        Template matching core shared by the approximate and sample entropies.
+
+        Two templates (runs of consecutive values) match when their Chebyshev
+        distance is at most r, i.e. when every pair of aligned points is within r.
+        The pointwise comparison is done once and the match matrices of lengths m
+        and m + 1 are built from its diagonal-shifted blocks.
 
+        Output:
+          M  -- (N - m + 1) x (N - m + 1) boolean matrix of length-m matches
+          M1 -- (N - m) x (N - m) boolean matrix of length-(m + 1) matches
+        """
+
+        U = numpy.asarray(U, dtype=float)
         N = len(U)
+        n = N - m + 1
+
+        close = numpy.abs(U[:, None] - U[None, :]) <= r
+
+        M = close[:n, :n].copy()
+        for k in range(1, m):
+            M &= close[k:k + n, k:k + n]
 
-        def _maxdist(x_i, x_j):
-            return max([abs(ua - va) for ua, va in zip(x_i, x_j)])
+        M1 = M[:n - 1, :n - 1] & close[m:m + n - 1, m:m + n - 1]
+        return M, M1
 
-        def _phi(m):
-            x = [[U[j] for j in range(i, i + m - 1 + 1)] for i in range(N - m + 1)]
-            C = [len([1 for x_j in x if _maxdist(x_i, x_j) <= r]) / (N - m + 1.0) for x_i in x]
-            return (N - m + 1.0)**(-1) * sum(numpy.log(C))
+    def approximate(U, m, r):
+
+        M, M1 = Entropy.templates(U, m, r)
+
+        def _phi(M):
+            n = len(M)
+            C = numpy.count_nonzero(M, axis=1) / n
+            return numpy.sum(numpy.log(C)) / n
+
+        return _phi(M) - _phi(M1)
+
+    def sample(U, m, r):
 
-        return _phi(m) - _phi(m + 1)
+        # A NaN template matches nothing, not even itself, which would skew the
+        # counts below: such windows are NaN, as in the other entropies
+        if not numpy.isfinite(U).all():
+            return numpy.nan
+
+        M, M1 = Entropy.templates(U, m, r)
+
+        # Both counts run over the same N - m templates and exclude self-matches.
+        # Without matches the entropy is inf (A = 0) or undefined (B = 0).
+        n = len(M1)
+        B = numpy.count_nonzero(M[:n, :n]) - n
+        A = numpy.count_nonzero(M1) - n
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            return -numpy.log(A / B)
 
 
 class Information:
 
-    def mutual(unlagged, lagged, local):
-        return mutual_info(unlagged, lagged, local)
+    def discretize(series, bins=None):
+
+        """
+        Symbols 0..k-1 of series. Without bins the values are truncated to integers as
+        pyinform does; with bins they are split into that many equal-frequency bins.
+        """
+
+        series = numpy.asarray(series)
+        if bins is None:
+            values = series.astype(numpy.int32)
+        else:
+            edges = numpy.quantile(series, numpy.linspace(0, 1, bins + 1)[1:-1])
+            values = numpy.searchsorted(edges, series, side='right')
+        return numpy.unique(values, return_inverse=True)[1].reshape(series.shape)
+
+    def binned(windows, bins):
+
+        """
+        Equal-frequency bins 0..bins-1 of the values of every window (..., period), each
+        window split by the quantiles of its own values: discretize applied to every
+        window on its own, up to the labels of the bins.
+        """
+
+        edges = numpy.quantile(windows, numpy.linspace(0, 1, bins + 1)[1:-1], axis=-1)
+        edges = numpy.moveaxis(edges, 0, -1)[..., None, :]
+        return numpy.sum(windows[..., None] >= edges, axis=-1) # searchsorted(side='right')
+
+    def mutual(unlagged, lagged, local=False, bins=None):
+
+        """
+        Mutual information in bits between two series, discretized as in discretize. With
+        local the pointwise values are returned, their mean being the mutual information.
+        """
+
+        x = Information.discretize(unlagged, bins)
+        y = Information.discretize(lagged, bins)
+        information = Information._local(x, y)
+        return information if local else numpy.mean(information)
+
+    def profile(series, max_delay, bins=None):
+
+        """
+        Mutual information in bits between series and itself delayed by 1..max_delay bars.
+        The series is discretized once, and the joint histograms of every delay come from a
+        single count over all (delay, x[t], x[t + delay]) triples. Delays leaving no pairs
+        are NaN.
+        """
+
+        codes = Information.discretize(series, bins)
+        n = len(codes)
+        delays = numpy.arange(1, min(max_delay, n - 1) + 1)
+
+        t = numpy.arange(n)[None, :]
+        valid = t + delays[:, None] < n
+        lag = numpy.broadcast_to(delays[:, None] - 1, valid.shape)[valid]
+        x = codes[numpy.broadcast_to(t, valid.shape)[valid]]
+        y = codes[(t + delays[:, None])[valid]]
+
+        information = numpy.full(max_delay, numpy.nan)
+        information[:len(delays)] = Information.grouped(x, y, lag, len(delays))
+        return information
+
+    def grouped(x, y, group, groups):
+
+        """
+        Mutual information in bits of many pairs of symbol series at once: the pairs
+        (x[i], y[i]) are split by group labels 0..groups-1, and the joint histograms of
+        all groups come from a single count. With n pairs in a group, joint counts c(a, b)
+        and marginal counts c(a), c(b) its mutual information is
+        log2(n) + (sum c(a, b) log2 c(a, b) - sum c(a) log2 c(a) - sum c(b) log2 c(b)) / n.
+        """
+
+        k = max(numpy.max(x, initial=0), numpy.max(y, initial=0)) + 1
+        n = numpy.bincount(group, minlength=groups)
+        joint = Information.count_sums(x * k + y, group, groups)
+        unlagged = Information.count_sums(x, group, groups)
+        lagged = Information.count_sums(y, group, groups)
+
+        with numpy.errstate(all='ignore'):
+            return numpy.log2(n) + (joint - unlagged - lagged) / n
+
+    def count_sums(symbols, group, groups):
+
+        """
+        sum c log2 c over the counts c of the symbols within each group, from one
+        histogram of (group, symbol) keys.
+        """
+
+        k = numpy.max(symbols, initial=0) + 1
+        key = group * k + symbols
+        if groups * k <= max(2**22, 4 * len(key)):
+            counts = numpy.bincount(key, minlength=groups * k)
+            bins = numpy.flatnonzero(counts)
+            counts = counts[bins]
+        else: # Too many symbols for a dense histogram
+            bins, counts = numpy.unique(key, return_counts=True)
+
+        return numpy.bincount(bins // k, weights=counts * numpy.log2(counts), minlength=groups)
+
+    def _local(x, y):
+
+        # Pointwise mutual information log2(n * c(x, y) / (c(x) * c(y))) of symbol pairs
+        k = max(numpy.max(x, initial=0), numpy.max(y, initial=0)) + 1
+        _, inverse, counts = numpy.unique(x * k + y, return_inverse=True, return_counts=True)
+        return numpy.log2(len(x) * counts[inverse] / (numpy.bincount(x)[x] * numpy.bincount(y)[y]))
 
 
 class Complexity:
 
     def binarizer(array):
+        """
+        Binarize every window along the last axis of array against its own mean
+        and pack the bits with numpy.packbits, 8 symbols per byte.
+
+        Input:
+          array -- (..., n) array, e.g. a stack of windows
 
-        mean = array.mean()
-        return [1 if element >= mean else 0 for element in array]
+        Output:
+          packed -- (..., ceil(n / 8)) uint8 array, unpack with length=n in lempel_ziv
+        """
+
+        mean = array.mean(axis=-1, keepdims=True)
+        return numpy.packbits(array >= mean, axis=-1)
 
-    def lempel_ziv(sequence):
+    def lempel_ziv(sequence, length=None):
         """
         Calculate Lempel-Ziv's algorithmic complexity using the LZ76 algorithm
         and the sliding-window implementation.
@@ -137,13 +301,60 @@ class Complexity:
         complexity of spatiotemporal patterns", Physical Review A, Volume 36,
         Number 2 (1987).
 
+        Each new component is one symbol longer than the longest run starting
+        at its position that already occurs (possibly overlapping) earlier in
+        the sequence. The runs are searched with bytes.find on a uint8 buffer,
+        so the scan runs in C instead of comparing symbols one by one.
+
         Input:
-          sequence -- array of integers
+          sequence -- array of integers, or bits packed by numpy.packbits
+          length   -- number of symbols when sequence is packed
 
         Output:
           complexity  -- integer
         """
 
+        if length is not None:
+            sequence = numpy.unpackbits(sequence, count=length)
+
+        sequence = numpy.ravel(sequence)
+        if sequence.dtype != numpy.uint8:
+            symbols, sequence = numpy.unique(sequence, return_inverse=True)
+            if len(symbols) > 256:
+                return Complexity._lempel_ziv(sequence)
+
+        buffer = sequence.astype(numpy.uint8).tobytes()
+        n = len(buffer)
+        complexity, l = 1, 1
+
+        def _seen(k): # Run of length k at l occurs at an earlier start (overlap allowed)
+            return buffer.find(buffer[l:l + k], 0, l + k - 1) != -1
+
+        while True:
+
+            # Longest seen run, by doubling then bisecting (seen runs are prefix-closed)
+            k, step = 0, 1
+            while k + step <= n - l and _seen(k + step):
+                k += step
+                step *= 2
+            high = min(k + step, n - l + 1)
+            while high - k > 1:
+                middle = (k + high) // 2
+                if _seen(middle):
+                    k = middle
+                else:
+                    high = middle
+
+            complexity += 1
+            l += k + 1
+            if l + 1 > n:
+                break
+
+        return complexity
+
+    def _lempel_ziv(sequence):
+
+        # Symbol by symbol Kaspar-Schuster scan, for alphabets that do not fit in a byte
         sequence = sequence.flatten().tolist()
 
         i, k, l = 0, 1, 1
@@ -196,68 +407,92 @@ class Fractal:
         constructed by linear regression. They are included in the output mainly for completeness.
         """
 
-        # Initialize
-        nq, ns = len(q_values), len(scale_values)
-        Ma = numpy.zeros([nq, ns])
-        Mf = numpy.zeros([nq, ns])
-        Md = numpy.zeros([nq, ns])
-
         log_l = numpy.log10(2**scale_values) # Window sizes l that vary in a dyadic scale
 
-        alpha = numpy.zeros([nq, 1])
-        falpha = numpy.zeros([nq, 1])
-        Dq = numpy.zeros([nq, 1])
+        # P(l), the cumulative probabilities of the windows, computed once for every scale
+        time_series = numpy.asarray(time_series, dtype=numpy.float64)
+        total = numpy.sum(time_series)
+        P = numpy.concatenate([numpy.sum(numpy.reshape(time_series, (2**s, -1)), axis=1) / total
+                               for s in scale_values])
 
-        Rsquared_alpha = numpy.zeros([nq, 1])
-        Rsquared_falpha = numpy.zeros([nq, 1])
-        Rsquared_Dq = numpy.zeros([nq, 1])
+        alpha, falpha, Dq, Rsquared_alpha, Rsquared_falpha, Rsquared_Dq, Ma, Mf, Md = Fractal.spectrum(P, q_values, scale_values)
 
+        return alpha[:, None], falpha[:, None], Dq[:, None], Rsquared_alpha[:, None], Rsquared_falpha[:, None], Rsquared_Dq[:, None], log_l, Ma, Mf, Md
 
-        # Calculate Ma(ij), Mf(ij), Md(ij)
+    def boxes(span, N, scale_values):
 
-        for i in range(nq): # Looping through q values
+        """
+        Box probabilities P(l) of every dyadic scale for every window of length N in span,
+        (len(span) - N + 1, boxes). The sums of 2**m consecutive values at every start are
+        built by doubling, sums[2 * size][k] = sums[size][k] + sums[size][k + size], so every
+        box sum of every window is a gather.
+        """
 
-            q = q_values[i]
+        windows = len(span) - N + 1
+        size = N // 2**max(scale_values)
+        sums = {size: numpy.sum(sliding_window_view(span, size), axis=-1)}
+        while size < N:
+            sums[2 * size] = sums[size][:-size] + sums[size][size:]
+            size *= 2
 
-            for j in range(ns): # Looping through scales
+        start = numpy.arange(windows)[:, None]
+        P = numpy.concatenate([sums[N // 2**s][start + numpy.arange(2**s) * (N // 2**s)]
+                               for s in scale_values], axis=1)
+        return P / sums[N][:windows, None]
 
-                # Calculate P(l), the cumulative probabilities of the windows
-                window = 2**scale_values[j]  # How many windows we will have at this scale
-                timeseries_windowed = numpy.reshape(time_series, (-1, window), order="F") # Break the time series into windows
-                P = numpy.sum(timeseries_windowed, axis=0) / sum(time_series)
+    def spectrum(P, q_values, scale_values):
 
+        """
+        Chhabra-Jensen estimates from the box probabilities P (..., boxes) of every scale in
+        scale_values laid end to end (2 + 4 + ... boxes), for any number of leading (window)
+        dimensions. Returns alpha, falpha, Dq and their R values as (..., nq) arrays, and
+        Ma, Mf, Md as (..., nq, ns) arrays; see fractal_analysis.
+        """
 
-                normalization = sum(P**q)
+        q = numpy.asarray(q_values, dtype=numpy.float64)[:, None]
+        log_l = numpy.log10(2**scale_values) # Window sizes l that vary in a dyadic scale
 
-                # Mα & Mf: A numerical approximation to the equations α(q) and f(q)
-                mu = (P**q) / normalization
-                Ma[i,j] = sum(mu * numpy.log10(P))
-                Mf[i,j] = sum(mu * numpy.log10(mu))
+        starts = numpy.cumsum([0] + [2**s for s in scale_values[:-1]])
+        scales = numpy.repeat(numpy.arange(len(scale_values)), 2**numpy.asarray(scale_values))
+        P = P[..., None, :]
 
+        # Calculate Ma(ij), Mf(ij), Md(ij) as (nq, ns) tensors, every q at once
+        with numpy.errstate(all='ignore'):
+            Pq = P**q
+            normalization = numpy.add.reduceat(Pq, starts, axis=-1)
 
-                # Md
-                Md[i,j] = numpy.log10(normalization) # Not accounting for q between 0 and 1
+            # Mα & Mf: A numerical approximation to the equations α(q) and f(q)
+            mu = Pq / normalization[..., scales]
+            Ma = numpy.add.reduceat(mu * numpy.log10(P), starts, axis=-1)
+            Mf = numpy.add.reduceat(mu * numpy.log10(mu), starts, axis=-1)
 
-                if q > 0 and q <= 1:
-                    Md[i,j] = sum(P * numpy.log10(P)) / normalization
+            # Md, not accounting for q between 0 and 1 except for that row set
+            Md = numpy.log10(normalization)
+            unit = (q[:, 0] > 0) & (q[:, 0] <= 1)
+            Md[..., unit, :] = numpy.add.reduceat(P * numpy.log10(P), starts, axis=-1) / normalization[..., unit, :]
 
+        # Regression: α(q) and f(q) can be obtained as the slopes by regressing Mα & Mf against the scales l: Mα ∼ l and Mf ∼ l
+        slopes, R = Fractal._regression(-log_l, numpy.stack([Ma, Mf, Md]))
+        Dq = slopes[2] / numpy.where(unit, 1, q[:, 0] - 1) # Not divided for q in (0, 1]
 
-            # Regression: α(q) and f(q) can be obtained as the slopes by regressing Mα & Mf against the scales l: Mα ∼ l and Mf ∼ l
-            slope_a, intercept, R2_a, p_value, std_err = stats.linregress(-log_l, Ma[i,:])
-            slope_f, intercept, R2_f, p_value, std_err = stats.linregress(-log_l, Mf[i,:])
-            slope_d, intercept, R2_d, p_value, std_err = stats.linregress(-log_l, Md[i,:])
+        return slopes[0], slopes[1], Dq, R[0], R[1], R[2], Ma, Mf, Md
 
-            alpha[i] = slope_a
-            falpha[i] = slope_f
+    def _regression(x, Y):
 
-            if q > 0 and q <= 1:
-                Dq[i] = slope_d
-            else:
-                Dq[i] = slope_d / (q - 1)
+        """
+        Least-squares slopes and correlation coefficients of every row of Y against x,
+        in closed form with the conventions of scipy.stats.linregress.
+        """
 
+        dx = x - numpy.mean(x)
+        dY = Y - numpy.mean(Y, axis=-1, keepdims=True)
+        ssxm = numpy.mean(dx * dx)
+        ssxym = numpy.mean(dY * dx, axis=-1)
+        ssym = numpy.mean(dY * dY, axis=-1)
 
-            Rsquared_alpha[i] = R2_a
-            Rsquared_falpha[i] = R2_f
-            Rsquared_Dq[i] = R2_d
+        with numpy.errstate(all='ignore'):
+            slope = ssxym / ssxm
+            r = numpy.clip(ssxym / numpy.sqrt(ssxm * ssym), -1.0, 1.0)
+        r = numpy.where(ssym == 0, numpy.where(ssxym == 0, numpy.nan, 0.0), r)
 
-        return alpha, falpha, Dq, Rsquared_alpha, Rsquared_falpha, Rsquared_Dq, log_l, Ma, Mf, Md
\ No newline at end of file
+        return slope, r
@@ -0,0 +1,446 @@
+import math
+import numpy
+from lib.salib import Entropy
+from lib.indicators.chaos import _lyapunov
+from lib.indicators.complexity import _lempel_ziv
+from lib.indicators.multifractal import _spectra, _grid
+
+
+class Shannon:
+    """
+    Shannon entropy of the last period values, updated in O(1) per bar.
+
+    With S = sum(x) and T = sum(x * log2(x)) over the window, the entropy
+    -sum(pk * log2(pk)) with pk = x / S reduces to log2(S) - T / S, so only the
+    running sums have to follow the bars entering and leaving the window. The
+    sums are recomputed from the ring buffer every resync bars to stop
+    floating-point drift from accumulating.
+
+    Windows holding non-positive or NaN values give NaN, as Entropy.shannon does.
+    """
+
+    def __init__(self, period: int, resync: int = 1000):
+
+        self.period, self.resync = period, resync
+        self.values = numpy.zeros(period)
+        self.xlogx = numpy.zeros(period)
+        self.valid = numpy.zeros(period, dtype=bool)
+        self.count = 0
+
+        self.total, self.total_xlogx, self.invalid = 0., 0., 0
+        self.since_resync = 0
+
+    def update(self, x):
+
+        i = self.count % self.period
+
+        if self.count >= self.period: # Leaving bar
+            if self.valid[i]:
+                self.total -= self.values[i]
+                self.total_xlogx -= self.xlogx[i]
+            else:
+                self.invalid -= 1
+
+        # Entering bar
+        self.values[i] = x
+        self.valid[i] = x > 0
+        if self.valid[i]:
+            self.xlogx[i] = x * numpy.log2(x)
+            self.total += x
+            self.total_xlogx += self.xlogx[i]
+        else:
+            self.invalid += 1
+
+        self.count += 1
+        self.since_resync += 1
+        if self.since_resync >= self.resync:
+            self.resynchronize()
+
+        if self.count < self.period or self.invalid:
+            return numpy.nan
+
+        return numpy.log2(self.total) - self.total_xlogx / self.total
+
+    def resynchronize(self):
+
+        self.total = numpy.sum(self.values[self.valid])
+        self.total_xlogx = numpy.sum(self.xlogx[self.valid])
+        self.since_resync = 0
+
+
+class ApproximateEntropy:
+    """
+    Approximate entropy of the last period values, updated in O(period * m) per bar.
+
+    The number of matches of every template in the window is kept for the
+    template lengths m and m + 1. When the window moves by one bar only the
+    leaving and entering templates are compared against the others and their
+    matches are subtracted from / added to the counts; Entropy.approximate
+    rebuilds every comparison instead. The counts are integers, so the result
+    is exactly the batch one.
+    """
+
+    def __init__(self, period: int, m: int = 2, r: float = 3):
+
+        self.period, self.m, self.r = period, m, r
+        self.window = numpy.zeros(period)
+        self.count = 0
+        self.counts = None
+
+    def update(self, x):
+
+        previous = self.window
+        self.window = numpy.append(previous[1:], x)
+        self.count += 1
+
+        if self.count < self.period:
+            return numpy.nan
+
+        if self.counts is None: # First full window
+            M, M1 = Entropy.templates(self.window, self.m, self.r)
+            self.counts = [numpy.count_nonzero(M, axis=1), numpy.count_nonzero(M1, axis=1)]
+        else:
+            self.counts = [self._shift(self.counts[0], previous, self.m),
+                           self._shift(self.counts[1], previous, self.m + 1)]
+
+        def _phi(counts):
+            n = len(counts)
+            return numpy.sum(numpy.log(counts / n)) / n
+
+        return _phi(self.counts[0]) - _phi(self.counts[1])
+
+    def _shift(self, counts, previous, m):
+
+        n = self.period - m + 1
+        window = self.window
+
+        # Matches of the remaining templates with the leaving one (first of previous)
+        leaving = numpy.ones(n - 1, dtype=bool)
+        for k in range(m):
+            leaving &= numpy.abs(previous[1 + k:n + k] - previous[k]) <= self.r
+
+        # Matches of every template in the new window with the entering one (last)
+        entering = numpy.ones(n, dtype=bool)
+        for k in range(m):
+            entering &= numpy.abs(window[k:n + k] - window[n - 1 + k]) <= self.r
+
+        counts = numpy.append(counts[1:] - leaving, 0) + entering
+        counts[-1] = numpy.count_nonzero(entering)
+        return counts
+
+
+class MutualInformation:
+    """
+    Mutual information in bits between x[t - delay] and x[t] over the last
+    period + delay values, updated in O(1) per bar.
+
+    Values are truncated to integer symbols as Information.mutual does without
+    bins. With n pairs, joint counts c(a, b) and marginal counts c(a), c(b) the
+    mutual information is
+
+      log2(n) + (sum c(a, b) log2 c(a, b) - sum c(a) log2 c(a) - sum c(b) log2 c(b)) / n
+
+    so only the counts of the entering and leaving pairs have to be updated,
+    together with the three running sums. The sums are recomputed from the
+    counts every resync bars to stop floating-point drift from accumulating.
+    """
+
+    def __init__(self, period: int, delay: int, resync: int = 1000):
+
+        self.period = period + delay # Bars per window
+        self.pairs, self.delay, self.resync = period, delay, resync
+        self.symbols = numpy.zeros(self.period, dtype=numpy.int64)
+        self.count = 0
+
+        self.joint, self.unlagged, self.lagged = {}, {}, {}
+        self.sums = [0., 0., 0.]
+        self.since_resync = 0
+
+    def update(self, x):
+
+        t, i = self.count, self.count % self.period
+
+        if t >= self.period: # Leaving pair
+            self._pair(self.symbols[i], self.symbols[(t - self.pairs) % self.period], -1)
+
+        self.symbols[i] = numpy.float64(x).astype(numpy.int32)
+
+        if t >= self.delay: # Entering pair
+            self._pair(self.symbols[(t - self.delay) % self.period], self.symbols[i], 1)
+
+        self.count += 1
+        self.since_resync += 1
+        if self.since_resync >= self.resync:
+            self.resynchronize()
+
+        if self.count < self.period:
+            return numpy.nan
+
+        n = self.pairs
+        return math.log2(n) + (self.sums[0] - self.sums[1] - self.sums[2]) / n
+
+    def resynchronize(self):
+
+        self.sums = [sum(c * math.log2(c) for c in counts.values())
+                     for counts in (self.joint, self.unlagged, self.lagged)]
+        self.since_resync = 0
+
+    def _pair(self, a, b, sign):
+
+        for k, (counts, key) in enumerate(((self.joint, (a, b)), (self.unlagged, a), (self.lagged, b))):
+            c = counts.get(key, 0)
+            if c + sign:
+                counts[key] = c + sign
+            else:
+                del counts[key]
+            self.sums[k] += _xlog2x(c + sign) - _xlog2x(c)
+
+
+def _xlog2x(c):
+    return c * math.log2(c) if c else 0.
+
+
+class Recurrence:
+    """
+    Recurrence quantification of the last period values, updated in O(period) per bar.
+
+    The values are embedded with the given dimension and delay, and two
+    embedded points recur when their squared Euclidean distance is below
+    radius**2, in float32 as pyrqa computes it. When the window moves by one
+    bar only the distances of the entering point are computed; they overwrite
+    the row and column of the leaving point in the recurrence matrix, which is
+    indexed by slot rather than shifted. Every diagonal and every column then
+    loses its first element and gains a new last one, so the line length
+    histograms are updated from the runs at the ends of each line (see _Runs).
+
+    update returns RR, DET, LAM, L_max, L_entr and TT with the settings of
+    lib.indicators.recurrence (Theiler corrector 1, minimum line length 2).
+    """
+
+    def __init__(self, period: int, radius: float = 0.65, dimension: int = 2, delay: int = 2):
+
+        self.period, self.radius = period, radius
+        self.dimension, self.delay = dimension, delay
+        self.size = period - (dimension - 1) * delay # Embedded points per window
+
+        # Points not seen yet are NaN and never recur
+        self.recent = numpy.zeros((dimension - 1) * delay + 1)
+        self.points = numpy.full((self.size, dimension), numpy.nan, dtype=numpy.float32)
+        self.matrix = numpy.zeros((self.size, self.size), dtype=bool)
+        self.count = 0
+        self.recurrences = 0
+
+        self.diagonals = _Runs(self.size)
+        self.verticals = _Runs(self.size)
+
+    def update(self, x):
+
+        self.recent = numpy.append(self.recent[1:], x)
+        self.count += 1
+
+        if self.count < len(self.recent):
+            return numpy.nan
+
+        W = self.size
+        t = self.count - len(self.recent) # Index of the entering point
+        slot = t % W                       # Slot of the leaving one
+        order = (t + 1 + numpy.arange(W)) % W # Slots of the new window in time order
+
+        point = self.recent[::self.delay].astype(numpy.float32)
+        difference = self.points - point
+        distance = numpy.zeros(W, dtype=numpy.float32)
+        for i in range(self.dimension):
+            distance += difference[:, i] * difference[:, i]
+        recurrent = distance < numpy.float32(self.radius) * numpy.float32(self.radius)
+        recurrent[slot] = True
+
+        # Diagonal k runs along points (a, a + k), only k >= 1 by the Theiler
+        # corrector; the new window starts at t - W + 1 and ends at t - k
+        k = numpy.arange(1, W)
+        following = self.matrix[order[0], order[k]]
+        following[-1] = False
+        self.diagonals.shift(k, W - k, following, recurrent[(t - k) % W], t - W + 1, t - k)
+
+        # Column j runs along points (a, j) for every point a of the window
+        columns = order[:-1]
+        self.verticals.shift(columns, W, self.matrix[order[0], columns], recurrent[columns],
+                             t - W + 1, t)
+        self.verticals.replace(slot, self.matrix[numpy.roll(order, 1), slot], recurrent[order],
+                               t - W + 1)
+
+        self.recurrences += 2 * numpy.count_nonzero(recurrent) - 1
+        self.recurrences -= 2 * numpy.count_nonzero(self.matrix[slot]) - self.matrix[slot, slot]
+        self.matrix[slot, :] = recurrent
+        self.matrix[:, slot] = recurrent
+        self.points[slot] = point
+
+        if self.count < self.period:
+            return numpy.nan
+
+        return self._measures()
+
+    def _measures(self):
+
+        # Frequency distributions indexed by line length - 1 as pyrqa keeps them,
+        # diagonals counted in both triangles, and its measures with its dtypes
+        diagonal = 2 * self.diagonals.histogram[1:].astype(numpy.uint64)
+        vertical = self.verticals.histogram[1:].astype(numpy.uint64)
+        lengths = numpy.arange(1, self.size + 1, dtype=numpy.uint64)
+
+        with numpy.errstate(all='ignore'):
+
+            rate = numpy.float32(self.recurrences) / (self.size * self.size)
+            determinism = numpy.float32(numpy.sum(lengths[1:] * diagonal[1:])) / numpy.float64(numpy.sum(lengths * diagonal))
+            laminarity = numpy.float32(numpy.sum(lengths[1:] * vertical[1:])) / numpy.float64(numpy.sum(lengths * vertical))
+            trapping = numpy.float32(numpy.sum(lengths[1:] * vertical[1:])) / numpy.float64(numpy.sum(vertical[1:]))
+
+            nonzero = diagonal.nonzero()[0]
+            longest = nonzero[-1] + 1 if nonzero.size else 0
+
+            entropy = numpy.float32(.0)
+            lines = numpy.array(diagonal[1:], dtype=numpy.float32)
+            lines = lines[lines.nonzero()[0]]
+            if lines.size:
+                total = numpy.sum(diagonal[1:])
+                entropy -= numpy.sum((lines / total) * numpy.log(lines / total))
+
+        return numpy.array([rate, determinism, laminarity, longest, entropy, trapping])
+
+
+class Window:
+    """
+    Base of the streams without an incremental form. The last period values
+    are kept in a ring buffer stored twice over, so the window in time order
+    is always a contiguous view, and kernel is evaluated on it every bar. The
+    latency per bar is one kernel call on period values, and the values are
+    exactly those of the batch indicator.
+    """
+
+    def __init__(self, period: int):
+
+        self.period = period
+        self.buffer = numpy.zeros(2 * period)
+        self.count = 0
+
+    def update(self, x):
+
+        i = self.count % self.period
+        self.buffer[i] = self.buffer[i + self.period] = x
+        self.count += 1
+
+        if self.count < self.period:
+            return numpy.nan
+
+        return self.kernel(self.buffer[i + 1:i + 1 + self.period])
+
+    def kernel(self, window):
+        raise NotImplementedError
+
+
+class LempelZiv(Window):
+    """ Lempel-Ziv complexity of the last period values, as lib.indicators.complexity. """
+
+    def kernel(self, window):
+        return _lempel_ziv(window[None, :])[0]
+
+
+class Lyapunov(Window):
+    """ Largest Lyapunov exponent of the last period values, as lib.indicators.chaos. """
+
+    def kernel(self, window):
+        return _lyapunov(window)
+
+
+class Multifractal(Window):
+    """
+    Multifractal spectrum of the last period values, as mfs in
+    lib.indicators.multifractal: width, height, alpha_0, asymmetry and D_range.
+    """
+
+    def __init__(self, period: int = 2 ** 7, q_range=(-40, 40)):
+
+        super().__init__(period)
+        grid = _grid(period, q_range)
+        self.q_values, self.scale_values = grid["q_values"], grid["scale_values"]
+
+    def kernel(self, window):
+        return _spectra(window[None, :], self.q_values, self.scale_values)[0]
+
+
+class _Runs:
+    """
+    Histogram of the lengths of the runs of True along boolean sequences that
+    drop their first element and append a new one every bar.
+
+    Only the run at the head of a sequence, which loses an element, and the run
+    at its tail, which may gain one, change length. The head and tail run
+    lengths are kept per sequence, and the length of every run that ended is
+    kept by its start position modulo size, to become the head run once the
+    elements before it have been dropped.
+    """
+
+    def __init__(self, size: int):
+
+        self.size = size
+        self.head = numpy.zeros(size, dtype=int)
+        self.tail = numpy.zeros(size, dtype=int)
+        self.closed = numpy.zeros((size, size), dtype=int)
+        self.histogram = numpy.zeros(size + 1, dtype=int)
+
+    def shift(self, index, length, following, appended, start, end):
+        """
+        Move the sequences index (of lengths length) by one element. following
+        holds their second elements, at position start, and appended the new
+        last ones, at position end.
+        """
+
+        length = numpy.broadcast_to(length, index.shape)
+        end = numpy.broadcast_to(end, index.shape)
+        head, tail = self.head[index], self.tail[index]
+
+        # Drop the first element; a sequence whose run covers it all loses it at both ends
+        self._count(head[head > 0], -1)
+        self._count(head[head > 1] - 1, 1)
+        head = numpy.maximum(head - 1, 0)
+        tail = numpy.minimum(tail, length - 1)
+
+        begins = following & (head == 0)
+        head[begins] = numpy.where(tail[begins] == length[begins] - 1, tail[begins],
+                                   self.closed[index[begins], start % self.size])
+
+        # Append the new element
+        extends = appended & (tail > 0)
+        self._count(tail[extends], -1)
+        self._count(tail[extends] + 1, 1)
+        self.histogram[1] += numpy.count_nonzero(appended & (tail == 0))
+        head[appended & (head == length - 1)] += 1
+
+        ends = ~appended & (tail > 0)
+        self.closed[index[ends], (end[ends] - tail[ends]) % self.size] = tail[ends]
+        tail = numpy.where(appended, tail + 1, 0)
+
+        self.head[index], self.tail[index] = head, tail
+
+    def replace(self, i, removed, inserted, start):
+        """ Replace sequence i, which held removed, with inserted starting at position start. """
+
+        starts, lengths = _runs(removed)
+        self._count(lengths, -1)
+
+        starts, lengths = _runs(inserted)
+        self._count(lengths, 1)
+
+        self.closed[i, (start + starts) % self.size] = lengths
+        self.head[i] = lengths[0] if starts.size and starts[0] == 0 else 0
+        self.tail[i] = lengths[-1] if starts.size and starts[-1] + lengths[-1] == len(inserted) else 0
+
+    def _count(self, lengths, sign):
+        self.histogram += sign * numpy.bincount(lengths, minlength=len(self.histogram))
+
+
+def _runs(values):
+    """ Start positions and lengths of the runs of True in a boolean array. """
+
+    edges = numpy.diff(numpy.concatenate(([0], values.astype(numpy.int8), [0])))
+    starts = numpy.flatnonzero(edges == 1)
+    return starts, numpy.flatnonzero(edges == -1) - starts
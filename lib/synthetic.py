@@ -0,0 +1,64 @@
+import numpy
+import pandas
+
+
+def gbm(n: int, mu: float = 0.0, sigma: float = 0.02, start: float = 100., seed: int = 0):
+    """ Geometric Brownian motion prices with drift mu and volatility sigma per bar. """
+
+    rng = numpy.random.default_rng(seed)
+    returns = rng.normal(mu - sigma**2 / 2, sigma, n)
+    return _series(start * numpy.exp(numpy.cumsum(returns)), "GBM")
+
+
+def garch(n: int, omega: float = 1e-6, alpha: float = 0.1, beta: float = 0.85,
+          start: float = 100., seed: int = 0):
+    """ Prices whose returns follow a GARCH(1, 1) process, with volatility clustering. """
+
+    rng = numpy.random.default_rng(seed)
+    shocks = rng.standard_normal(n)
+    returns = numpy.empty(n)
+    variance = omega / (1 - alpha - beta) # Unconditional variance
+
+    for t in range(n):
+        returns[t] = numpy.sqrt(variance) * shocks[t]
+        variance = omega + alpha * returns[t]**2 + beta * variance
+
+    return _series(start * numpy.exp(numpy.cumsum(returns)), "GARCH")
+
+
+def logistic(n: int, r: float = 4.0, seed: int = 0):
+    """ Chaotic logistic map x -> r x (1 - x) from a seeded start in (0.1, 0.9). """
+
+    rng = numpy.random.default_rng(seed)
+    x = numpy.empty(n)
+    x[0] = rng.uniform(0.1, 0.9)
+    for t in range(1, n):
+        x[t] = r * x[t - 1] * (1 - x[t - 1])
+
+    return _series(x, "Logistic map")
+
+
+def cascade(n: int, weight: float = 0.7, seed: int = 0):
+    """
+    Binomial multiplicative cascade: at every level each interval passes weight
+    of its mass to one half, picked at random, and 1 - weight to the other.
+    The first n cells of the finest level are returned.
+    """
+
+    rng = numpy.random.default_rng(seed)
+    levels = int(numpy.ceil(numpy.log2(max(n, 2))))
+    mass = numpy.ones(1)
+
+    for _ in range(levels):
+        left = numpy.where(rng.random(len(mass)) < 0.5, weight, 1 - weight)
+        mass = numpy.column_stack((mass * left, mass * (1 - left))).ravel()
+
+    return _series(mass[:n] * len(mass), "Multifractal cascade")
+
+
+GENERATORS = {"gbm": gbm, "garch": garch, "logistic": logistic, "cascade": cascade}
+
+
+def _series(values, name):
+    index = pandas.date_range("2000-01-01", periods=len(values), freq="min")
+    return pandas.Series(values, index=index, name=name)
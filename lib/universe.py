@@ -0,0 +1,100 @@
+import numpy
+import pandas
+from numpy.lib.stride_tricks import sliding_window_view
+
+from lib.salib import Entropy
+from lib.progress import reporter
+from lib.rolling import execute
+from lib.indicators.entropy import shen
+from lib.indicators.complexity import complexity, _lempel_ziv
+
+
+def universe(data, indicator, n_jobs: int = 1, progress=None, **parameters):
+    """
+    Compute a rolling indicator for every column of a wide frame at once.
+
+    Input:
+      data       -- pandas.DataFrame (columns = tickers) or 2-D array (bars x series)
+      indicator  -- one of the indicator functions in lib.indicators, e.g. shen
+      n_jobs     -- number of worker processes for the indicators that cannot be
+                    broadcast across columns, -1 for one per CPU
+      progress   -- lib.progress.Progress or callback, advanced once per finished column
+      parameters -- passed on to indicator (period, delay, q_range, ...)
+
+    Output:
+      pandas.DataFrame aligned with data, one column per series, or one per
+      series and measure (a (series, measure) MultiIndex) for the indicators
+      returning several, such as mfs or rqa
+
+    Shannon entropy and Lempel-Ziv complexity are evaluated on the windows of
+    all columns together. Other indicators, or these ones with extra options,
+    run column by column on a process pool. The multifractal spectrum is one
+    of them: its arithmetic, not the per-series overhead, dominates.
+    """
+
+    frame = data if isinstance(data, pandas.DataFrame) else pandas.DataFrame(data)
+
+    progress = reporter(progress)
+    if progress is not None:
+        progress.start(indicator.__name__, len(frame.columns))
+
+    if indicator in BROADCAST and set(parameters) <= BROADCAST[indicator][1]:
+        values = BROADCAST[indicator][0](frame.values, **parameters)
+        result = pandas.DataFrame(values, index=frame.index, columns=frame.columns)
+        if progress is not None:
+            progress.advance(len(frame.columns))
+            progress.finish()
+        return result
+
+    results = [None] * len(frame.columns)
+
+    def _collect(k, output):
+        results[k] = output
+        if progress is not None:
+            progress.advance()
+
+    tasks = [(indicator, frame[column], parameters) for column in frame.columns]
+    execute(_column, tasks, n_jobs, _collect)
+
+    if progress is not None:
+        progress.finish()
+    return pandas.concat(results, axis=1, keys=frame.columns)
+
+
+def _column(indicator, series, parameters):
+
+    result = indicator(series, **parameters)
+    return result["indicator"] if list(result.columns) == ["indicator"] else result
+
+
+def _broadcast(values, period, kernel):
+    """
+    Apply a kernel taking a (series, windows, period) stack to every window of
+    every column, in chunks of bars so the stack stays around 16M values.
+    """
+
+    values = numpy.asarray(values, dtype=numpy.float64)
+    N, C = values.shape
+    result = numpy.full((N, C), numpy.nan)
+    columns = numpy.ascontiguousarray(values.T) # Contiguous windows along the last axis
+
+    chunk = max(1, 2**24 // max(C * period, 1))
+    for start in range(period - 1, N, chunk):
+        stop = min(start + chunk, N)
+        stack = sliding_window_view(columns[:, start - (period - 1):stop], period, axis=1)
+        result[start:stop] = kernel(stack).T
+
+    return result
+
+
+def _shannon(values, period):
+    return _broadcast(values, period, Entropy.shannon)
+
+
+def _complexity(values, period):
+    return _broadcast(values, period, _lempel_ziv)
+
+
+# indicator: (broadcast function, parameters it takes)
+BROADCAST = {shen: (_shannon, {"period"}),
+             complexity: (_complexity, {"period"})}
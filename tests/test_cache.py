@@ -0,0 +1,78 @@
+import os
+import numpy
+
+from lib.cache import Cache
+from lib.synthetic import gbm
+from lib.indicators.entropy import shen
+
+
+def _entries(cache):
+    return [name for name in os.listdir(cache.directory) if name.endswith(".npy")]
+
+
+def test_lookup_hits_only_the_same_key_and_bars(tmp_path):
+
+    cache = Cache(str(tmp_path))
+    data = gbm(200, seed=9)
+    result = numpy.arange(200.)
+    key = cache.key("indicator", 20)
+
+    assert cache.lookup(key, data.values, data.index) == (0, None)
+    cache.store(key, data.values, data.index, result)
+
+    done, cached = cache.lookup(key, data.values, data.index)
+    assert done == 200
+    numpy.testing.assert_array_equal(cached, result)
+
+    revised = data.values.copy()
+    revised[10] += 1
+    assert cache.lookup(key, revised, data.index) == (0, None)
+    assert cache.lookup(cache.key("indicator", 21), data.values, data.index) == (0, None)
+
+
+def test_extension_computes_only_the_new_bars(tmp_path):
+
+    cache = Cache(str(tmp_path))
+    data = gbm(400, seed=10)
+    shen(data.iloc[:300], 50, cache=cache)
+
+    reports = []
+    extended = shen(data, 50, cache=cache, progress=reports.append)
+    assert reports[-1]["total"] == 100
+    numpy.testing.assert_array_equal(extended.values, shen(data, 50).values)
+
+    # Rerun on the same bars: loaded, nothing computed
+    reports.clear()
+    shen(data, 50, cache=cache, progress=reports.append)
+    assert reports[-1]["total"] == 0
+
+
+def test_extensions_replace_the_prefix_they_were_computed_from(tmp_path):
+
+    cache = Cache(str(tmp_path))
+    data = gbm(500, seed=11)
+    for bars in (200, 300, 400, 500):
+        shen(data.iloc[:bars], 50, cache=cache)
+    assert len(_entries(cache)) == 1
+
+    # A prefix that was not extended, here of another key, stays
+    shen(data.iloc[:200], 30, cache=cache)
+    assert len(_entries(cache)) == 2
+
+
+def test_least_recently_used_results_are_evicted(tmp_path):
+
+    data = gbm(1000, seed=12)
+    result = numpy.zeros(1000)
+    cache = Cache(str(tmp_path), max_bytes=2 * 8000 + 1000) # Two results fit
+    keys = [cache.key("indicator", k) for k in range(3)]
+
+    cache.store(keys[0], data.values, data.index, result)
+    cache.store(keys[1], data.values, data.index, result)
+    cache.lookup(keys[0], data.values, data.index) # Used after keys[1]
+    cache.store(keys[2], data.values, data.index, result)
+
+    assert len(_entries(cache)) == 2
+    assert cache.lookup(keys[1], data.values, data.index) == (0, None)
+    assert cache.lookup(keys[0], data.values, data.index)[0] == 1000
+    assert cache.lookup(keys[2], data.values, data.index)[0] == 1000
@@ -0,0 +1,32 @@
+import numpy
+import pytest
+
+from lib.synthetic import gbm
+from lib.salib import Information
+from lib.indicators.information import cross_mutual
+
+
+def _series(bars, count):
+    return numpy.stack([gbm(bars, seed=seed).values for seed in range(count)], axis=1)
+
+
+@pytest.mark.parametrize("bins", [None, 4])
+def test_cross_mutual_does_not_look_ahead(bins):
+
+    values = _series(300, 3) if bins else numpy.floor(_series(300, 3) * 2)
+    numpy.testing.assert_array_equal(cross_mutual(values[:200], 40, 3, bins=bins),
+                                     cross_mutual(values, 40, 3, bins=bins)[:200])
+
+
+def test_cross_mutual_bins_every_window_as_mutual_does():
+
+    values = _series(200, 2)
+    tensor = cross_mutual(values, 30, 2, bins=4)
+    for t in (31, 120, 199):
+        for i in range(2):
+            for j in range(2):
+                for tau in range(-2, 3):
+                    x = values[t - 29 - max(tau, 0):t + 1 - max(tau, 0), i]
+                    y = values[t - 29 - max(-tau, 0):t + 1 - max(-tau, 0), j]
+                    assert tensor[t, i, j, 2 + tau] == pytest.approx(
+                        Information.mutual(x, y, bins=4), abs=1e-12)
@@ -0,0 +1,82 @@
+import numpy
+import pandas
+import pytest
+
+import lib.rolling
+from lib.synthetic import gbm
+from lib.loader import load, output, to_npy
+from lib.indicators.entropy import shen
+from lib.indicators.multifractal import mfs, mfs_width, _spectra, _grid
+
+
+def _close(directory, bars):
+
+    numpy.save(directory / "close.npy", gbm(bars, seed=15).values)
+    return load(str(directory / "close.npy"))
+
+
+def test_load_maps_npy_files(tmp_path):
+
+    close = gbm(500, seed=13).values
+    numpy.save(tmp_path / "close.npy", close)
+    bars = numpy.zeros(500, dtype=[("time", "i8"), ("close", "f8")])
+    bars["time"], bars["close"] = numpy.arange(500) * 60, close
+    numpy.save(tmp_path / "bars.npy", bars)
+
+    series = load(str(tmp_path / "close.npy"))
+    assert isinstance(series.values, numpy.memmap)
+    numpy.testing.assert_array_equal(series.values, close)
+
+    series = load(str(tmp_path / "bars.npy"), "close", index="time")
+    numpy.testing.assert_array_equal(series.values, close)
+    numpy.testing.assert_array_equal(series.index, bars["time"])
+
+    directory = load(str(tmp_path), "close")
+    numpy.testing.assert_array_equal(directory.values, close)
+
+    with pytest.raises(ValueError):
+        load(str(tmp_path / "bars.npy"), "open")
+
+
+def test_memory_mapped_output(tmp_path):
+
+    data = _close(tmp_path, 400)
+    out = output(str(tmp_path / "shen.npy"), len(data))
+    shen(data, 50, out=out)
+    out.flush()
+    numpy.testing.assert_array_equal(numpy.load(tmp_path / "shen.npy"), shen(data, 50).values[:, 0])
+
+
+def test_to_npy_round_trip(tmp_path):
+
+    pyarrow = pytest.importorskip("pyarrow")
+    import pyarrow.parquet
+
+    frame = pandas.DataFrame({"time": numpy.arange(300) * 60, "close": gbm(300, seed=14).values})
+    pyarrow.parquet.write_table(pyarrow.Table.from_pandas(frame, preserve_index=False),
+                                str(tmp_path / "bars.parquet"), row_group_size=70)
+    to_npy(str(tmp_path / "bars.parquet"), str(tmp_path / "npy"), batch=64)
+
+    series = load(str(tmp_path / "npy"), "close", index="time")
+    numpy.testing.assert_array_equal(series.values, frame["close"].values)
+    numpy.testing.assert_array_equal(series.index, frame["time"].values)
+
+
+def test_chunked_multifractal_equals_unchunked(tmp_path, monkeypatch):
+
+    data = _close(tmp_path, 700)
+    whole, width = mfs(data, 2**6), mfs_width(data, 2**6)
+
+    monkeypatch.setattr(lib.rolling, "CHUNK", 97)
+    out = output(str(tmp_path / "width.npy"), len(data))
+    numpy.testing.assert_array_equal(mfs(data, 2**6).values, whole.values)
+    numpy.testing.assert_array_equal(mfs_width(data, 2**6, out=out).values, width.values)
+    numpy.testing.assert_array_equal(out, whole["width"].values)
+
+    # The spectrum tensors are built a few windows at a time: one window per call agrees
+    stack = lib.rolling.windows(data.values, 2**6)
+    grid = _grid(2**6, (-40, 40))
+    numpy.testing.assert_array_equal(_spectra(stack, **grid),
+                                     numpy.concatenate([_spectra(stack[k:k + 1], **grid)
+                                                        for k in range(len(stack))]))
+
@@ -0,0 +1,19 @@
+import pytest
+
+from lib.synthetic import gbm
+from lib.streaming import Multifractal
+from lib.indicators.multifractal import mfs, mfs_width, mfs_height
+
+
+@pytest.mark.parametrize("indicator", [mfs, mfs_width, mfs_height])
+@pytest.mark.parametrize("length", [50, 96, 1])
+def test_length_has_to_be_a_power_of_two(indicator, length):
+
+    with pytest.raises(ValueError, match="power of two"):
+        indicator(gbm(300, seed=8), length)
+
+
+def test_stream_length_has_to_be_a_power_of_two():
+
+    with pytest.raises(ValueError, match="power of two"):
+        Multifractal(50)
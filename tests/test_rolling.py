@@ -0,0 +1,53 @@
+import numpy
+import pandas
+import pytest
+
+from lib.synthetic import gbm
+from lib.indicators.entropy import shen
+from lib.indicators.multifractal import mfs_width
+from lib.indicators.recurrence import rate
+
+
+def test_previous_result_is_extended():
+
+    data = gbm(400, seed=5)
+    extended = shen(data, 50, previous=shen(data.iloc[:300], 50))
+    numpy.testing.assert_array_equal(extended.values, shen(data, 50).values)
+
+
+def test_revised_history_is_rejected():
+
+    data = gbm(400, seed=6)
+    previous = shen(data.iloc[:300], 50)
+    revised = data.copy()
+    revised.iloc[50] *= 1.5
+
+    with pytest.raises(ValueError, match="changed"):
+        shen(revised, 50, previous=previous)
+
+
+def test_previous_result_without_fingerprint_is_rejected():
+
+    # Copied into a frame of the user's, the result loses its attrs
+    data = gbm(400, seed=6)
+    frame = pandas.DataFrame(index=data.index[:300])
+    frame["SE"] = shen(data.iloc[:300], 50)["indicator"]
+    revised = data.copy()
+    revised.iloc[50] *= 1.5
+
+    for bars in (data, revised):
+        with pytest.raises(ValueError, match="fingerprint"):
+            shen(bars, 50, previous=frame[["SE"]])
+
+
+@pytest.mark.parametrize("indicator, parameters", [(shen, {"period": 50}), (mfs_width, {}),
+                                                    (rate, {"period": 30, "incremental": True})])
+def test_renamed_previous_result_is_extended(indicator, parameters):
+
+    data = gbm(400, seed=7)
+    full = indicator(data, **parameters)
+    previous = indicator(data.iloc[:300], **parameters).rename(columns={"indicator": "renamed"})
+
+    for renamed in (previous, previous["renamed"]):
+        extended = indicator(data, previous=renamed, **parameters)
+        numpy.testing.assert_array_equal(extended.values, full.values)
@@ -0,0 +1,96 @@
+import numpy
+import pytest
+
+from lib.synthetic import gbm
+from lib.streaming import LempelZiv, Lyapunov, Multifractal
+from lib.indicators.entropy import shen, apen
+from lib.indicators.recurrence import rqa
+from lib.indicators.information import mutual
+from lib.indicators.complexity import complexity
+from lib.indicators.chaos import lyapunov
+from lib.indicators.multifractal import mfs
+
+
+def _replay(stream, data, width=1):
+
+    # NaN while warming up, a value (or width values) per bar afterwards
+    rows = [numpy.broadcast_to(stream.update(x), (width,)) for x in data.values]
+    return numpy.array(rows).reshape(len(data), -1)
+
+
+def _assert_matches(incremental, batch, rtol):
+
+    incremental, batch = incremental.values, batch.values
+    numpy.testing.assert_array_equal(numpy.isnan(incremental), numpy.isnan(batch))
+    numpy.testing.assert_allclose(incremental, batch, rtol=rtol, equal_nan=True)
+
+
+@pytest.mark.parametrize("period", [2, 20, 64])
+def test_shannon_matches_batch(period):
+
+    data = gbm(600, seed=1)
+    _assert_matches(shen(data, period, incremental=True), shen(data, period), rtol=1e-9)
+
+
+@pytest.mark.parametrize("resync", [1, 7, 50])
+def test_shannon_across_resync_boundaries(resync):
+
+    # Resynchronizations fall inside and at the edges of windows
+    data = gbm(400, seed=2)
+    _assert_matches(shen(data, 30, incremental=True, resync=resync), shen(data, 30), rtol=1e-9)
+
+
+def test_shannon_non_positive_and_nan_windows():
+
+    data = gbm(300, seed=3)
+    data.iloc[[40, 150]] = numpy.nan
+    data.iloc[90] = 0.
+    data.iloc[200] = -1.
+
+    with numpy.errstate(all="ignore"):
+        batch = shen(data, 25)
+    incremental = shen(data, 25, incremental=True, resync=13)
+
+    # Every window holding one of the bars is NaN, the others recover
+    assert numpy.isnan(batch.values[[40, 64, 90, 114, 150, 200, 224], 0]).all()
+    assert numpy.isfinite(batch.values[[65, 115, 175, 225], 0]).all()
+    _assert_matches(incremental, batch, rtol=1e-9)
+
+
+@pytest.mark.parametrize("period", [10, 40])
+def test_approximate_entropy_equals_batch(period):
+
+    # Match counts are integers, so the incremental result is exactly the batch one
+    data = gbm(300, seed=4, sigma=0.05)
+    incremental, batch = apen(data, period, incremental=True), apen(data, period)
+    numpy.testing.assert_array_equal(incremental.values, batch.values)
+
+
+@pytest.mark.filterwarnings("ignore::DeprecationWarning") # pyopencl calls inside pyrqa
+def test_recurrence_equals_pyrqa():
+
+    # Same float32 distances, Theiler corrector and line counts as pyrqa
+    data = gbm(110, seed=5, sigma=0.005)
+    data = (data - data.mean()) / data.std()
+    incremental, batch = rqa(data, 40, incremental=True), rqa(data, 40)
+    numpy.testing.assert_array_equal(incremental.values, batch.values)
+
+
+@pytest.mark.parametrize("resync", [1, 37, 1000])
+def test_mutual_information_matches_batch(resync):
+
+    # Counts are exact, only the running sums of c log2 c drift between resyncs
+    data = gbm(500, seed=6, sigma=0.03)
+    incremental = mutual(data, 48, 7, None, incremental=True, resync=resync)
+    _assert_matches(incremental, mutual(data, 48, 7, None), rtol=1e-12)
+
+
+# Several times period bars, so the ring buffer wraps around repeatedly
+@pytest.mark.parametrize("stream, batch, period, width", [
+    (LempelZiv, complexity, 32, 1), (Lyapunov, lyapunov, 40, 1), (Multifractal, mfs, 2**5, 5)])
+def test_window_streams_replay_batch(stream, batch, period, width):
+
+    data = gbm(7 * period + 3, seed=7, sigma=0.02)
+    replayed = _replay(stream(period), data, width)
+    numpy.testing.assert_array_equal(replayed, batch(data, period).values)
+
@@ -0,0 +1,39 @@
+import numpy
+import pandas
+
+from lib.synthetic import gbm
+from lib.universe import universe
+from lib.indicators.entropy import shen
+from lib.indicators.multifractal import mfs, mfs_width
+
+
+def _frame(bars, series):
+    return pandas.DataFrame({"T%d" % k: gbm(bars, seed=k).values for k in range(series)})
+
+
+def test_broadcast_equals_column_by_column():
+
+    frame = _frame(300, 3)
+    result = universe(frame, shen, period=40)
+    for column in frame.columns:
+        numpy.testing.assert_allclose(result[column], shen(frame[column], 40)["indicator"],
+                                      rtol=1e-12, equal_nan=True)
+
+
+def test_multifractal_width_per_column():
+
+    frame = _frame(300, 2)
+    result = universe(frame, mfs_width, length=2**6)
+    assert list(result.columns) == list(frame.columns)
+    for column in frame.columns:
+        numpy.testing.assert_array_equal(result[column],
+                                         mfs_width(frame[column], 2**6)["indicator"])
+
+
+def test_multi_measure_indicator_has_a_measure_level():
+
+    frame = _frame(300, 2)
+    result = universe(frame, mfs, length=2**6)
+    assert list(result.columns) == [(column, measure) for column in frame.columns
+                                    for measure in mfs(frame["T0"], 2**6).columns]
+    numpy.testing.assert_array_equal(result["T1"].values, mfs(frame["T1"], 2**6).values)